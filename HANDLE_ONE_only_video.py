@@ -4,8 +4,10 @@ import os
 import logging
 import requests
 
-from download_video_by_url_and_make_frames import create_thumbnails_for_video_message, get_video_duration
-from upload_only_VIDEO_vector import process_only_video_data, delete_frames
+from download_video_by_url_and_make_frames import create_thumbnails_for_video_message, frames_to_multipart, \
+    save_frames_to_disk
+from upload_only_VIDEO_vector import delete_frames
+from frame_dedup import dedupe_frames
 
 # Настройка логирования
 logging.basicConfig(filename='processing.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -53,26 +55,13 @@ def log_unprocessed_video(video_id):
         file.write(f"{video_id}\n")
 
 
-def process_only_video_data(video_id):
+def process_only_video_data(video_id, frames):
     url = "http://176.109.106.184:8000/encode"
-    json_file_path = 'video_description/all_videos.json'
-    frames_dir = "frames"
-
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        all_videos = json.load(file)
-
-    video_url = all_videos.get(video_id, {}).get('url', None)
     text = None
 
-    files = []
-    file_handles = []
     try:
-        for filename in os.listdir(frames_dir):
-            if filename.startswith(f'key_frame_{video_id}_') and filename.endswith(('.jpg', '.jpeg', '.png')):
-                file_path = os.path.join(frames_dir, filename)
-                file_handle = open(file_path, 'rb')
-                files.append(('images', (filename, file_handle, 'image/jpeg')))
-                file_handles.append(file_handle)
+        # Кадры передаются из памяти, без промежуточной папки frames
+        files = frames_to_multipart(video_id, frames)
         data = {'texts': [text]}
 
         response = requests.post(url, files=files, data=data)
@@ -96,9 +85,6 @@ def process_only_video_data(video_id):
         image_vectors = None
         text_vector = None
         result = False
-    finally:
-        for file_handle in file_handles:
-            file_handle.close()
 
     return result, image_vectors, text_vector
 
@@ -147,22 +133,24 @@ def main_handle_videos():
         start_time = time.time()
 
         output_folder = "frames"
-        frames, video_duration, frames_count = create_thumbnails_for_video_message(video_id,
-                                                                                   all_videos[video_id]['url'],
-                                                                                   output_folder)
+        frames, video_duration, frames_count, video_path = create_thumbnails_for_video_message(
+            video_id, all_videos[video_id]['url'], output_folder)
+        os.unlink(video_path)
+        frames, frames_dropped = dedupe_frames(frames)
 
-        success, image_vectors, text_vector = process_only_video_data(video_id)
+        success, image_vectors, text_vector = process_only_video_data(video_id, frames)
         if success and image_vectors is not None:
             vectors[video_id] = {
                 "url": all_videos[video_id]['url'],
                 "vectors": image_vectors  # Список тензоров (списков) для каждого изображения
             }
-            delete_frames(output_folder, video_id)
-            log_message = f"Successfully processed data for {video_id} and frames deleted."
+            if save_frames_to_disk:
+                delete_frames(output_folder, video_id)
+            log_message = f"Successfully processed data for {video_id}."
             print(log_message)
             logging.info(log_message)
         else:
-            log_message = f"Data for {video_id} was not processed, frames remain in the folder."
+            log_message = f"Data for {video_id} was not processed."
             print(log_message)
             logging.warning(log_message)
             log_unprocessed_video(video_id)
@@ -173,7 +161,8 @@ def main_handle_videos():
         statistics[video_id] = {
             "processing_time": total_time,
             "video_duration": video_duration,
-            "frames_count": frames_count
+            "frames_count": frames_count,
+            "frames_dropped": frames_dropped
         }
 
         log_message = f"Total execution time for {video_id}: {total_time} seconds"
@@ -4,24 +4,54 @@ import os
 import logging
 import requests
 import spacy
-import whisper
 
-from subtitles_extraction_easyocr_extra import get_subtitles
-from translation import translate_text
-from download_video_by_url_and_make_frames import create_thumbnails_for_video_message, get_video_duration
-from whisper_extraction import encode_and_transcribe
+from subtitles_extraction_easyocr_extra import get_subtitles, subtitles_config
+from translation import translate_text, needs_translation, translation_version, phrase_cache
+from download_video_by_url_and_make_frames import create_thumbnails_for_video_message, download_video, \
+    frames_to_multipart, save_frames_to_disk
+from whisper_extraction import encode_and_transcribe, whisper_model_name, language_routing, \
+    language_probability_threshold
+from asr_engines import load_asr_engine
+from voice_activity import vad_config
 from upload_only_VIDEO_vector import process_only_video_data, delete_frames
 from key_words_extraction import extract_keywords
-from create_db import VideoIndex
+from create_db import get_video_index
+from ingestion_pipeline import Stage, create_worker_pools, run_stage_graph
+from frame_dedup import dedupe_frames, dedup_hamming_threshold
+from scene_detection import fast_mode_default, fast_threshold_factor
+from artifact_cache import ArtifactCache, artifact_cache_dir, hash_file
 
 
 # переменная для хранения модели spaCy
 nlp = spacy.load("en_core_web_sm")
-# загрузка модели whisper
-whisper_model = whisper.load_model('small')
+# загрузка движка распознавания речи (ASR_ENGINE: whisper или faster-whisper)
+asr_engine = load_asr_engine(model_name=whisper_model_name)
 
-# инициализация индекса видео
-video_index = VideoIndex(db_name="video_database", collection_name="videos")
+# индекс видео (общий экземпляр, подключение к MongoDB при первой записи)
+video_index = get_video_index()
+
+# пулы потоков для этапов обработки видео
+worker_pools = create_worker_pools()
+
+# кэш артефактов этапов (пустой ARTIFACT_CACHE_DIR отключает кэш)
+artifact_cache = ArtifactCache() if artifact_cache_dir else None
+
+# модель сервиса кодирования (см. Fast_API.clip_id)
+encoder_model_id = 'laion/CLIP-ViT-g-14-laion2B-s12B-b42K'
+
+# версии моделей и настроек этапов: изменение версии пересчитывает этап и зависящие от него этапы
+stage_versions = {
+    'keyframes': f'scenes-v1:threshold=7.5:thumbnails=15:fast={fast_mode_default}'
+                 + (f':min_scene_len=15:factor={fast_threshold_factor}' if fast_mode_default else ''),
+    'dedupe_frames': f'dhash-v1:threshold={dedup_hamming_threshold}',
+    'subtitles_ocr': f'easyocr-ru-en-v1:{subtitles_config}',
+    'subtitles_text': f'{translation_version}:en_core_web_sm-v1',
+    'transcription': f'{asr_engine.version}:vad={vad_config}:routing={language_routing}:'
+                     f'min_language_probability={language_probability_threshold}',
+    'transcription_text': translation_version,
+    'translate_description': translation_version,
+    'encode': encoder_model_id,
+}
 
 
 # Настройка журнала с именем 'HANDLE1_logging'
@@ -65,19 +95,12 @@ def extract_video_id(url: str) -> str:
     unique_id = parts[-2]
     return unique_id
 
-def process_only_video_data(video_id, all_texts):
+def process_only_video_data(video_id, all_texts, frames):
     url = "http://176.109.106.184:8000/encode"
-    frames_dir = "frames"
 
-    files = []
-    file_handles = []
     try:
-        for filename in os.listdir(frames_dir):
-            if filename.startswith(f'key_frame_{video_id}_') and filename.endswith(('.jpg', '.jpeg', '.png')):
-                file_path = os.path.join(frames_dir, filename)
-                file_handle = open(file_path, 'rb')
-                files.append(('images', (filename, file_handle, 'image/jpeg')))
-                file_handles.append(file_handle)
+        # Кадры передаются из памяти, без промежуточной папки frames
+        files = frames_to_multipart(video_id, frames)
         data = {'texts': all_texts}
 
         response = requests.post(url, files=files, data=data)
@@ -101,62 +124,135 @@ def process_only_video_data(video_id, all_texts):
         image_vectors = None
         text_vector = None
         result = False
-    finally:
-        for file_handle in file_handles:
-            file_handle.close()
 
     return result, image_vectors, text_vector
 
-def main_handle_videos(video_name, description_name):
-    vectors = {}
-    statistics = {}
-
+def build_video_stages(video_id, video_url, description, output_folder, video_path=None):
+    """
+    Граф этапов обработки одного видео.
+
+    OCR, распознавание речи и извлечение ключевых кадров зависят только от скачанного файла
+    и выполняются одновременно; перевод и кодирование ждут только свои входные данные.
+    Если video_path передан (видео скачано заранее), этап скачивания только возвращает путь.
+    Результаты этапов кэшируются по хэшу содержимого видео и версиям этапов (stage_versions).
+    """
+    def download(_):
+        if video_path is not None:
+            return video_path
+        return download_video(video_id, video_url)
+
+    def video_hash(deps):
+        return hash_file(deps['download'])
+
+    def translate_description(_):
+        # Перевод описания в английский язык (английское описание не переводится)
+        if description is None:
+            return None
+        return translate_text(description) if needs_translation(description) else description
+
+    def keyframes(deps):
+        return create_thumbnails_for_video_message(video_id, video_url, output_folder, video_path=deps['download'])
+
+    def subtitles_ocr(deps):
+        # блок извлечения субтитров (сбой OCR - ошибка этапа, а не результат, и не кэшируется)
+        return get_subtitles(deps['download'], raise_errors=True)
+
+    def subtitles_text(deps):
+        subtitles, _ = deps['subtitles_ocr'] or (None, None)
+        print(subtitles)
+        if subtitles is None:
+            return None
+        subtitles_by_keywords = extract_keywords(subtitles, nlp)
+        print(subtitles_by_keywords)
+        if subtitles_by_keywords is None:
+            return None
+        subtitles_translated = translate_text(subtitles_by_keywords) if needs_translation(subtitles_by_keywords) \
+            else subtitles_by_keywords
+        if subtitles_translated is None:
+            return None
+        return extract_keywords(subtitles_translated, nlp)
+
+    def transcription(deps):
+        #извлечение аудиодорожки с помощью Whisper (сбой - ошибка этапа, а не результат, и не кэшируется)
+        return encode_and_transcribe(deps['download'], asr_engine, raise_errors=True)
+
+    def transcription_text(deps):
+        audio_transcription, _ = deps['transcription'] or (None, None)
+        print(audio_transcription)
+        if audio_transcription is None:
+            return None
+        # при определении языка Whisper уже возвращает английский текст
+        audio_transcription_translated = translate_text(audio_transcription) if needs_translation(audio_transcription) \
+            else audio_transcription
+        print(audio_transcription_translated)
+        return audio_transcription_translated
+
+    def dedupe(deps):
+        # удаление почти одинаковых кадров перед кодированием
+        frames, _, _, _ = deps['keyframes'] or ([], None, 0, None)
+        return dedupe_frames(frames)
+
+    def encode(deps):
+        all_texts = [text for text in (deps['translate_description'], deps['subtitles_text'], deps['transcription_text'])
+                     if text]
+        frames, _, _, _ = deps['keyframes'] or ([], None, 0, None)
+        # при сбое удаления дубликатов кодируются все кадры
+        frames, _ = deps['dedupe_frames'] or (frames, 0)
+        result = process_only_video_data(video_id, all_texts, frames)
+        if not result[0]:
+            # ошибка этапа не попадает в кэш
+            raise RuntimeError("Encoder did not return vectors")
+        return result
+
+    stages = [
+        Stage('download', download, pool='io'),
+        Stage('video_hash', video_hash, deps=('download',), pool='io', content_key=True),
+        # английское описание не занимает очередь модели перевода
+        Stage('translate_description', translate_description,
+              pool='translation' if description and needs_translation(description) else 'io', key_data=description or ''),
+        Stage('keyframes', keyframes, deps=('download', 'video_hash'), pool='cpu'),
+        Stage('dedupe_frames', dedupe, deps=('keyframes',), pool='cpu'),
+        Stage('subtitles_ocr', subtitles_ocr, deps=('download', 'video_hash'), pool='ocr'),
+        Stage('subtitles_text', subtitles_text, deps=('subtitles_ocr',), pool='translation'),
+        Stage('transcription', transcription, deps=('download', 'video_hash'), pool='asr'),
+        Stage('transcription_text', transcription_text, deps=('transcription',), pool='translation'),
+        Stage('encode', encode, deps=('keyframes', 'dedupe_frames', 'translate_description', 'subtitles_text',
+                                      'transcription_text'), pool='io'),
+    ]
+    for stage in stages:
+        stage.version = stage_versions.get(stage.name)
+    return stages
+
+def handle_video(video_name, description_name, video_path=None):
+    """
+    Обработка одного видео без записи общих файлов (журнала необработанных видео и JSON статистики),
+    поэтому функцию можно вызывать из нескольких процессов одновременно.
+
+    :return: Кортеж (успех, статистика видео).
+    """
     # Ввод ссылки на видео и описания
     video_url = video_name
-    description = description_name
-
-    all_texts = []
-    # Перевод описания в русский язык
-    if description is not None:
-        description = translate_text(description)  # Перевод описания в русский язык
-        all_texts.append(description)
-
     video_id = extract_video_id(video_url)  # Использование функции extract_video_id для получения ID видео
 
     start_time = time.time()
+    # Доля попаданий в кэш переводов считается только по запросам этого видео
+    cache_stats_before = phrase_cache.get_stats()
 
     output_folder = "frames"
-    frames, video_duration, frames_count, video_path = create_thumbnails_for_video_message(video_id, video_url, output_folder)
-
-    # блок извлечения субтитров
-    subtitles, subtitles_processing_time = get_subtitles(video_path)
-
-
-    cleaned_subtitles = None
-    print(subtitles)
-    if subtitles is not None:
-
-        subtitles_by_keywords = extract_keywords(subtitles, nlp)
-        print(subtitles_by_keywords)
-        if subtitles_by_keywords is not None:
-            subtitles_translated = translate_text(subtitles_by_keywords)
-            if subtitles_translated is not None:
-                cleaned_subtitles = extract_keywords(subtitles_translated, nlp)
-                all_texts.append(cleaned_subtitles)
+    graph = run_stage_graph(build_video_stages(video_id, video_url, description_name, output_folder, video_path),
+                            worker_pools, cache=artifact_cache)
+    results = graph.results
+
+    description = results['translate_description']
+    cleaned_subtitles = results['subtitles_text']
+    audio_transcription_translated = results['transcription_text']
+    _, subtitles_processing_time = results['subtitles_ocr'] or (None, None)
+    _, audio_processing_time = results['transcription'] or (None, 0)
+    video_path = results['download']
+    frames, video_duration, frames_count, _ = results['keyframes'] or ([], None, 0, video_path)
+    _, frames_dropped = results['dedupe_frames'] or (frames, 0)
+    success, image_vectors, text_vector = results['encode'] or (False, None, None)
 
-
-
-    audio_transcription_translated = None
-    #извлечение аудиодорожки с помощью Whisper
-    audio_transcription, audio_processing_time = encode_and_transcribe(video_path, whisper_model)
-    print(audio_transcription)
-    if audio_transcription is not None:
-        audio_transcription_translated = translate_text(audio_transcription)
-        if audio_transcription_translated is not None:
-            print(audio_transcription_translated)
-            all_texts.append(audio_transcription_translated)
-
-    success, image_vectors, text_vector = process_only_video_data(video_id, all_texts)
     if success and image_vectors is not None:
         # Учитываем наличие векторов и сохраняем в правильном порядке
         description_vector, subtitle_vector, audio_vector = None, None, None
@@ -172,50 +268,68 @@ def main_handle_videos(video_name, description_name):
 
         video_index.add_video(video_id, image_vectors, description_vector, subtitle_vector, audio_vector)
 
-        delete_frames(output_folder, video_id)
-        log_message = f"Successfully processed data for {video_id} and frames deleted."
+        if save_frames_to_disk:
+            delete_frames(output_folder, video_id)
+        log_message = f"Successfully processed data for {video_id}."
         print(log_message)
         logging.info(log_message)
-
-        #блок извлечения субтитров
-        subtitles, subtitles_processing_time = get_subtitles(video_path)
-
-        if subtitles:
-            subtitles = translate_text(subtitles)
-
     else:
-        log_message = f"Data for {video_id} was not processed, frames remain in the folder."
+        log_message = f"Data for {video_id} was not processed."
         print(log_message)
         logging.warning(log_message)
-        log_unprocessed_video(video_id)
 
     end_time = time.time()
     total_time = end_time - start_time
+    cache_stats = phrase_cache.get_stats()
+    cache_lookups = cache_stats['lookups'] - cache_stats_before['lookups']
+    cache_misses = cache_stats['misses'] - cache_stats_before['misses']
 
-    statistics[video_id] = {
+    video_statistics = {
         "processing_time": total_time,
         "video_duration": video_duration,
         "frames_count": frames_count,
+        "frames_dropped": frames_dropped,
         "description": description if description else None,
         "subtitles": cleaned_subtitles if cleaned_subtitles else None,
         "subtitles_processing_time": subtitles_processing_time,
         "audio_transription": audio_transcription_translated if audio_transcription_translated else None,
-        "audio_transription_processing": audio_processing_time
+        "audio_transription_processing": audio_processing_time,
+        "stage_timings": graph.timings,
+        "stage_errors": {name: str(error) for name, error in graph.errors.items()},
+        "cached_stages": graph.cached,
+        "translation_cache_hit_rate": (cache_lookups - cache_misses) / cache_lookups if cache_lookups else None
     }
 
-    log_message = f"Total execution time for {video_id}: {total_time} seconds"
+    log_message = f"Total execution time for {video_id}: {total_time} seconds (stages: " + \
+                  ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in graph.timings.items()) + ")"
     print(log_message)
     logging.info(log_message)
 
-    log_message = f"Video duration for {video_id}: {video_duration} seconds, frames count: {frames_count}"
+    log_message = f"Video duration for {video_id}: {video_duration} seconds, frames count: {frames_count}, " \
+                  f"duplicates dropped: {frames_dropped}"
     print(log_message)
     logging.info(log_message)
 
+    # Удаление видео после обработки
+    if video_path is not None:
+        os.unlink(video_path)
+
+    return success and image_vectors is not None, video_statistics
+
+def main_handle_videos(video_name, description_name, video_path=None):
+    vectors = {}
+    statistics = {}
+
+    video_id = extract_video_id(video_name)
+    success, statistics[video_id] = handle_video(video_name, description_name, video_path)
+    if not success:
+        log_unprocessed_video(video_id)
+
     # Сохранение данных после обработки видео
     save_json(vectors, vectors_file_path)
     save_json(statistics, statistics_file_path)
-    # Удаление видео после обработки
-    os.unlink(video_path)
+
+    return success
 
 if __name__ == "__main__":
     try:
@@ -1,93 +1,48 @@
 import time
-import os
 import logging
 import numpy as np
-from pymongo import MongoClient
 
 from translation import translate_text
 from upload_search_request_to_CLIP import process_search_request
-from faiss_module import FaissIndex  # Ваш класс FaissIndex
+from mongo_connection import get_collection, default_db_name
+from search_ranking import compute_total_weights, rank_videos
+from faiss_sync import load_synced_index, sync_faiss_index
+from vector_snapshot import newest_index_source, load_snapshot
 
 # Настройка логирования
 logging.basicConfig(filename='processing.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(message)s')
 
 # Параметры базы данных
-db_name = 'video_database'
+db_name = default_db_name  # MONGO_DB
 collection_name = 'videos'
-index_mapping_collection_name = 'index_mapping'
-
-# Путь к файлу для записи и загрузки индекса
-index_file_path = 'combined_vectors.faiss'
-
-# Весовые коэффициенты
-v_weight = 0.6  # Вес для видео
-d_weight = 0.1  # Вес для описания
-s_weight = 0.1  # Вес для субтитров
-a_weight = 0.2  # Вес для аудио
-
-
-
-# Функция для загрузки векторов из MongoDB
-def load_vectors_from_db():
-    client = MongoClient("mongodb://mongo:27017/")
-    db = client[db_name]
-    collection = db[collection_name]
-
-    vectors = []
-    ids = []
-    types = []
-
-    cursor = collection.find({})
-    for document in cursor:
-        video_id = document['id']
-        if document['video_vectors']:
-            for vec in document['video_vectors']:
-                vectors.append(np.frombuffer(vec, dtype='float32'))
-                ids.append(video_id)
-                types.append('video')
-        if document.get('description_vector') is not None:
-            vectors.append(np.frombuffer(document['description_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('description')
-        if document.get('subtitle_vector') is not None:
-            vectors.append(np.frombuffer(document['subtitle_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('subtitle')
-        if document.get('audio_vector') is not None:
-            vectors.append(np.frombuffer(document['audio_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('audio')
-
-    return vectors, ids, types
-
-try:
-    vectors, ids, types = load_vectors_from_db()
-    logging.info("Successfully loaded vectors from MongoDB.")
-except Exception as e:
-    logging.error(f"Failed to load vectors from MongoDB: {str(e)}")
-    raise
-
-# Размерность векторов
-d = len(vectors[0])
-logging.info(f"Vector dimension: {d}")
-
-# Создание или загрузка Faiss индекса
-index = FaissIndex(d, index_type='FlatL2')
-
-if os.path.exists(index_file_path):
-    # Загрузка индекса из файла
-    index.load_index(index_file_path)
-    logging.info("Loaded existing Faiss index.")
+
+# Адреса видео из снимка (None - адреса читаются из MongoDB)
+video_urls = None
+
+# Из снимка и синхронизированного индекса загружается более свежий
+index_source = newest_index_source()
+
+if index_source is not None and index_source[0] == 'snapshot':
+    # Холодный старт из снимка без обращения к MongoDB
+    snapshot = load_snapshot(index_source[1])
+    index = snapshot.build_index()
+    ids, types = snapshot.ids, snapshot.types
+    video_urls = snapshot.video_urls()
+    logging.info(f"Loaded Faiss index from snapshot {snapshot.path}.")
 else:
-    # Добавление векторов и сохранение индекса
-    index.add_vectors(np.vstack(vectors))
-    index.save_index(index_file_path)
-    logging.info("Created and saved new Faiss index.")
+    if index_source is None:
+        # Первый запуск: индекс строится из MongoDB один раз и сохраняется на диск
+        sync_faiss_index()
+    # Индекс и связи строк читаются с диска, из MongoDB - только изменения после последней версии
+    index, ids, types = load_synced_index(catch_up=True)
+    logging.info(f"Loaded synced Faiss index with {index.get_total_vectors()} vectors.")
+
+# Суммарные веса векторов каждого видео
+total_weights = snapshot.total_weights() if video_urls is not None else compute_total_weights(ids, types)
 
 def user_search_request(word):
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client[db_name]
-    video_collection = db[collection_name]
+    if video_urls is None:
+        video_collection = get_collection(collection_name, db_name)
 
     # Ввод слова или фразу для поиска
     search_query = word
@@ -118,54 +73,17 @@ def user_search_request(word):
         faiss_search_time = time.time() - start_faiss_time
         logging.info(f"FAISS search time: {faiss_search_time:.2f} seconds.")
 
-        # Создание карты расстояний и корректировка весов
-        id_distance_map = {}
-        for i in range(k):
-            idx = indices[0][i]
-            video_id = ids[idx]
-            vector_type = types[idx]
-            distance = distances[0][i]
-
-            if vector_type == 'video':
-                weight = v_weight
-            elif vector_type == 'description':
-                weight = d_weight
-            elif vector_type == 'subtitle':
-                weight = s_weight
-            elif vector_type == 'audio':
-                weight = a_weight
-            else:
-                weight = 1  # Default weight if type is unknown
-
-            if video_id in id_distance_map:
-                id_distance_map[video_id] += distance * weight
-            else:
-                id_distance_map[video_id] = distance * weight
-
-        # Корректировка весов для видео
-        total_weights = {video_id: 0 for video_id in id_distance_map.keys()}
-        for idx, video_id in enumerate(ids):
-            if types[idx] == 'video':
-                total_weights[video_id] += v_weight
-            elif types[idx] == 'description':
-                total_weights[video_id] += d_weight
-            elif types[idx] == 'subtitle':
-                total_weights[video_id] += s_weight
-            elif types[idx] == 'audio':
-                total_weights[video_id] += a_weight
-
-        for video_id in id_distance_map.keys():
-            if total_weights[video_id] != 1:
-                id_distance_map[video_id] /= total_weights[video_id]
-
-        # Сортировка по суммарному расстоянию
-        sorted_results = sorted(id_distance_map.items(), key=lambda item: item[1])
+        # Агрегация расстояний по видео с учетом весов
+        sorted_results = rank_videos(distances[0], indices[0], ids, types, total_weights)
 
         # Формирование результатов
         video_results = []
         for video_id, total_distance in sorted_results[:10]:
-            video_doc = video_collection.find_one({'id': video_id})
-            video_url = video_doc.get('url', '')
+            if video_urls is not None:
+                video_url = video_urls.get(video_id, '')
+            else:
+                video_doc = video_collection.find_one({'id': video_id})
+                video_url = video_doc.get('url', '')
             video_results.append({
                 "url": video_url,
                 "video_distance": float(total_distance)
@@ -12,7 +12,7 @@ server_ip = '176.109.106.184'
 server_port = 8080
 
 # Пути к скриптам на удаленном сервере
-remote_script_path = '/home/user1/projects/DataSearchBoss/create_FAISS_index.py'
+remote_sync_script_path = '/home/user1/projects/DataSearchBoss/faiss_sync.py'
 remote_handle_script_path = '/home/user1/projects/DataSearchBoss/HANDLE_ONE_with_MONGO.py'
 remote_search_script_path = '/home/user1/projects/DataSearchBoss/HANDLE_TWO_search_with_FAISS.py'
 
@@ -49,7 +49,17 @@ def run_remote_script(script_path, args=None):
 
 @app.get("/recreate_faiss/")
 def run_create_faiss_index():
-    stdout, stderr = run_remote_script(remote_script_path)
+    # Полная перестройка версии индекса, которую загружает поиск
+    stdout, stderr = run_remote_script(remote_sync_script_path, args='--full')
+    if stderr:
+        raise HTTPException(status_code=500, detail=f"Error: {stderr}")
+    logging.info(f"Encoded response: {stdout}")
+    return {"stdout": stdout}
+
+
+@app.get("/sync_faiss/")
+def run_sync_faiss_index(full: bool = False):
+    stdout, stderr = run_remote_script(remote_sync_script_path, args='--full' if full else None)
     if stderr:
         raise HTTPException(status_code=500, detail=f"Error: {stderr}")
     logging.info(f"Encoded response: {stdout}")
@@ -0,0 +1,50 @@
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+import logging
+
+from async_search import AsyncSearchService
+from translation import phrase_cache
+
+# Настройка логирования
+logging.basicConfig(filename='api_requests.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+search_service = AsyncSearchService()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Индекс загружается один раз, соединения переиспользуются между запросами
+    await search_service.start()
+    yield
+    await search_service.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/search/")
+async def search_videos(word: str):
+    try:
+        results = await search_service.search(word)
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    logging.info(f"Search results for '{word}': {results}")
+    return {"results": results}
+
+
+@app.get("/translation_cache_stats/")
+def translation_cache_stats():
+    # Доля запросов перевода, найденных в кэше фраз
+    return phrase_cache.get_stats()
+
+
+@app.get("/")
+def read_root():
+    return {"message": "Welcome to the asynchronous video search API. Use /search/?word=... to search for videos."}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8090)
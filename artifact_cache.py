@@ -0,0 +1,141 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import logging
+
+# Каталог кэша артефактов этапов обработки
+artifact_cache_dir = os.environ.get('ARTIFACT_CACHE_DIR', 'artifact_cache')
+# Предельный размер кэша в байтах (0 - без ограничения); при превышении удаляются давно не использованные артефакты
+artifact_cache_max_bytes = int(os.environ.get('ARTIFACT_CACHE_MAX_BYTES', str(20 * 1024 ** 3)))
+# Доля предельного размера, до которой кэш очищается при превышении
+artifact_cache_evict_ratio = 0.9
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """
+    SHA-256 содержимого файла (ключ видео в кэше).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_key(name, version, dep_keys=(), key_data=''):
+    """
+    Ключ артефакта этапа: хэш имени, версии модели/настроек этапа, ключей этапов-зависимостей
+    и дополнительных входных данных.
+
+    Так как в ключ входят ключи зависимостей, изменение версии одного этапа меняет ключи
+    только этого этапа и этапов, зависящих от него.
+    """
+    digest = hashlib.sha256()
+    for part in (name, version, *dep_keys, key_data):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root=artifact_cache_dir, max_bytes=artifact_cache_max_bytes):
+        """
+        Хранилище артефактов этапов на диске с адресацией по содержимому.
+
+        Размер ограничен max_bytes: при превышении удаляются артефакты с самым старым временем
+        последнего использования (mtime обновляется при чтении).
+
+        :param root: Каталог кэша.
+        :param max_bytes: Предельный размер кэша в байтах (0 или None - без ограничения).
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Оценка размера кэша (None - еще не подсчитан); другие процессы тоже пишут в каталог,
+        # поэтому при превышении размер пересчитывается по диску
+        self.size = None
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.pkl')
+
+    def get(self, key):
+        """
+        :return: Кортеж (найден ли артефакт, артефакт).
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                artifact = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception as e:
+            # Поврежденный артефакт считается отсутствующим и будет пересчитан
+            logging.warning(f"Artifact cache entry {path} is unreadable: {str(e)}")
+            self.misses += 1
+            return False, None
+        try:
+            # Время последнего использования для вытеснения
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return True, artifact
+
+    def put(self, key, artifact):
+        # Запись через временный файл и атомарное переименование
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+            pickle.dump(artifact, file, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path = file.name
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        if self.max_bytes:
+            with self.lock:
+                if self.size is None:
+                    self.size = sum(entry_size for _, _, entry_size in self._entries())
+                else:
+                    self.size += size
+                if self.size > self.max_bytes:
+                    self.evict()
+
+    def _entries(self):
+        # Список (время использования, путь, размер) всех артефактов
+        entries = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.pkl'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """
+        Удаление давно не использованных артефактов, пока размер кэша не станет
+        меньше artifact_cache_evict_ratio * max_bytes.
+        """
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, _, entry_size in entries)
+        target = self.max_bytes * artifact_cache_evict_ratio
+        removed = 0
+        for _, path, entry_size in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed += 1
+        self.size = size
+        logging.info(f"Artifact cache: evicted {removed} entries, {size / 1024 ** 2:.1f} MB left")
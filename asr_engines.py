@@ -0,0 +1,164 @@
+import os
+import abc
+import logging
+
+# Движок распознавания речи: 'whisper' (эталонный PyTorch) или 'faster-whisper' (CTranslate2, int8 на CPU)
+asr_engine_default = os.environ.get('ASR_ENGINE', 'whisper')
+asr_compute_type = os.environ.get('ASR_COMPUTE_TYPE', 'int8')
+
+
+class ASREngine(abc.ABC):
+    """
+    Общий интерфейс движков распознавания речи.
+
+    transcribe принимает аудио 16 кГц float32 и возвращает кортеж (сегменты, язык), где сегмент -
+    словарь с ключами start, end, text и no_speech_prob.
+    """
+    name = 'base'
+
+    @abc.abstractmethod
+    def transcribe(self, audio, language='ru', task='transcribe'):
+        pass
+
+    @abc.abstractmethod
+    def detect_language(self, audio):
+        """
+        Определение языка речи по первым 30 секундам аудио.
+
+        :return: Кортеж (код языка, вероятность).
+        """
+
+    @property
+    def version(self):
+        # Строка для версии этапа в кэше артефактов
+        return self.name
+
+
+class WhisperEngine(ASREngine):
+    name = 'whisper'
+
+    def __init__(self, model_name='small', model=None):
+        """
+        Эталонный Whisper (openai-whisper, PyTorch fp32).
+
+        :param model_name: Размер модели.
+        :param model: Уже загруженная модель whisper (если есть).
+        """
+        import whisper
+        self.model_name = model_name
+        self.model = model if model is not None else whisper.load_model(model_name)
+
+    def transcribe(self, audio, language='ru', task='transcribe'):
+        result = self.model.transcribe(audio, language=language, task=task)
+        segments = [{'start': segment['start'], 'end': segment['end'], 'text': segment['text'],
+                     'no_speech_prob': segment.get('no_speech_prob', 0.0)} for segment in result['segments']]
+        return segments, result.get('language', language)
+
+    def detect_language(self, audio):
+        import whisper
+        segment = whisper.pad_or_trim(audio)
+        n_mels = getattr(self.model.dims, 'n_mels', 80)
+        mel = whisper.log_mel_spectrogram(segment, n_mels) if n_mels != 80 else whisper.log_mel_spectrogram(segment)
+        _, probs = self.model.detect_language(mel.to(self.model.device))
+        language = max(probs, key=probs.get)
+        return language, probs[language]
+
+    @property
+    def version(self):
+        return f'{self.name}-{self.model_name}'
+
+
+class FasterWhisperEngine(ASREngine):
+    name = 'faster-whisper'
+
+    def __init__(self, model_name='small', compute_type=asr_compute_type, cpu_threads=0, beam_size=1):
+        """
+        Whisper на CTranslate2 (faster-whisper) с квантованием весов.
+
+        :param model_name: Размер модели.
+        :param compute_type: Тип вычислений ('int8', 'int8_float32', 'float32').
+        :param cpu_threads: Число потоков (0 - по умолчанию CTranslate2).
+        :param beam_size: Ширина луча (1 - жадное декодирование, как у эталонного transcribe).
+        """
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise ImportError("Для движка faster-whisper установите пакет faster-whisper") from e
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self.model = WhisperModel(model_name, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads)
+
+    def transcribe(self, audio, language='ru', task='transcribe'):
+        segments, info = self.model.transcribe(audio, language=language, task=task, beam_size=self.beam_size)
+        segments = [{'start': segment.start, 'end': segment.end, 'text': segment.text,
+                     'no_speech_prob': segment.no_speech_prob} for segment in segments]
+        return segments, info.language
+
+    def detect_language(self, audio):
+        # Язык определяется до декодирования: сегменты - ленивый генератор и не перебираются
+        _, info = self.model.transcribe(audio[:30 * 16000], language=None, beam_size=1)
+        return info.language, info.language_probability
+
+    @property
+    def version(self):
+        return f'{self.name}-{self.model_name}-{self.compute_type}-beam{self.beam_size}'
+
+
+# Размер модели openai-whisper по размерностям (n_mels, n_text_state, n_text_layer, многоязычная)
+whisper_model_sizes = {
+    (80, 384, 4, True): 'tiny', (80, 384, 4, False): 'tiny.en',
+    (80, 512, 6, True): 'base', (80, 512, 6, False): 'base.en',
+    (80, 768, 12, True): 'small', (80, 768, 12, False): 'small.en',
+    (80, 1024, 24, True): 'medium', (80, 1024, 24, False): 'medium.en',
+    (80, 1280, 32, True): 'large-v2',
+    (128, 1280, 32, True): 'large-v3',
+    (128, 1280, 4, True): 'turbo',
+}
+
+
+def whisper_model_size(model):
+    """
+    Размер загруженной модели openai-whisper по model.dims (None, если размер не распознан).
+
+    large и large-v1 совпадают по размерностям с large-v2 и не различаются.
+    """
+    dims = getattr(model, 'dims', None)
+    if dims is None:
+        return None
+    return whisper_model_sizes.get((dims.n_mels, dims.n_text_state, dims.n_text_layer, dims.n_vocab >= 51865))
+
+
+asr_engines = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+
+def load_asr_engine(name=asr_engine_default, model_name='small', **kwargs):
+    """
+    Создание движка распознавания речи по имени.
+    """
+    if name not in asr_engines:
+        raise ValueError(f"Неизвестный движок распознавания речи: {name}, доступны: {sorted(asr_engines)}")
+    engine = asr_engines[name](model_name, **kwargs)
+    logging.info(f"Loaded ASR engine {engine.version}")
+    return engine
+
+
+def as_asr_engine(model, model_name=None):
+    """
+    Движок для уже загруженной модели openai-whisper (или сам движок).
+
+    Имя модели входит в версию этапа в кэше артефактов, поэтому оно берется у вызывающего кода
+    или определяется по размерностям модели, а не подставляется наугад.
+
+    :param model: ASREngine или модель openai-whisper.
+    :param model_name: Размер модели (по умолчанию определяется по model.dims).
+    """
+    if isinstance(model, ASREngine):
+        return model
+    model_name = model_name or whisper_model_size(model)
+    if model_name is None:
+        raise TypeError("Не удалось определить размер модели whisper: передайте model_name или ASREngine")
+    return WhisperEngine(model_name=model_name, model=model)
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+
+from translation import translate_text
+from mongo_connection import get_async_client, default_db_name
+from search_ranking import compute_total_weights, rank_videos
+from faiss_sync import load_synced_index, sync_faiss_index
+from vector_snapshot import newest_index_source, load_snapshot
+
+# Настройка логирования
+logging.basicConfig(filename='search_processing.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Адрес сервиса кодирования CLIP
+encoder_url = "http://176.109.106.184:8000/encode"
+
+# Параметры базы данных
+db_name = default_db_name  # MONGO_DB
+collection_name = 'videos'
+
+# Период проверки новой версии индекса (снимка или синхронизации), секунды; 0 - без перезагрузки
+index_reload_interval = float(os.environ.get('SEARCH_INDEX_RELOAD_INTERVAL', '10'))
+
+
+class AsyncEncoderClient:
+    def __init__(self, url=encoder_url, max_connections=100, max_keepalive_connections=20,
+                 connect_timeout=5.0, read_timeout=30.0, retries=3, backoff=0.5):
+        """
+        Асинхронный клиент сервиса кодирования с пулом keep-alive соединений.
+
+        :param url: Адрес эндпоинта /encode.
+        :param max_connections: Максимальное число одновременных соединений.
+        :param max_keepalive_connections: Число соединений, удерживаемых открытыми.
+        :param connect_timeout: Таймаут установки соединения, секунды.
+        :param read_timeout: Таймаут ожидания ответа, секунды.
+        :param retries: Количество повторов при сетевых ошибках и ответах 5xx.
+        :param backoff: Базовая задержка экспоненциального повтора, секунды.
+        """
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections),
+        )
+
+    async def encode_text(self, query_text):
+        """
+        Получение вектора текста от сервиса CLIP.
+
+        :param query_text: Текст запроса.
+        :return: Кортеж (успех, вектор).
+        """
+        if not query_text:
+            logging.error("Empty query text provided.")
+            return False, None
+
+        data = {'texts': [query_text]}
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.post(self.url, data=data)
+                if response.status_code == 200:
+                    text_features = response.json().get('text_features', None)
+                    if text_features is None:
+                        logging.error("No text_features found in the response.")
+                        return False, None
+                    return True, text_features[0]
+                if response.status_code < 500:
+                    logging.error(f"Failed to get a proper response. Status code: {response.status_code}\nResponse: {response.text}")
+                    return False, None
+                logging.warning(f"Encoder returned {response.status_code}, attempt {attempt + 1}/{self.retries + 1}")
+            except (httpx.TransportError, ValueError) as e:
+                logging.warning(f"Encoder request failed: {str(e)}, attempt {attempt + 1}/{self.retries + 1}")
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+        logging.error(f"Encoder is unavailable after {self.retries + 1} attempts.")
+        return False, None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AsyncSearchService:
+    def __init__(self, encoder=None, mongo_client=None, k=500, top_n=10,
+                 faiss_workers=4, translation_workers=2, reload_interval=index_reload_interval):
+        """
+        Асинхронный конвейер поиска: перевод, кодирование, поиск FAISS и выборка метаданных.
+
+        Ожидания сети (CLIP, MongoDB) разных запросов перекрываются в одном цикле событий,
+        а FAISS и перевод выполняются в отдельных пулах потоков.
+
+        :param encoder: Экземпляр AsyncEncoderClient (создается, если не передан).
+        :param mongo_client: AsyncIOMotorClient (по умолчанию общий клиент mongo_connection).
+        :param k: Количество ближайших соседей для поиска.
+        :param top_n: Количество видео в ответе.
+        :param faiss_workers: Размер пула потоков для поиска FAISS.
+        :param translation_workers: Размер пула потоков для перевода.
+        :param reload_interval: Период проверки новой версии индекса, секунды (0 - без перезагрузки).
+        """
+        self.encoder = encoder or AsyncEncoderClient()
+        self.mongo_client = mongo_client or get_async_client()
+        self.video_collection = self.mongo_client[db_name][collection_name]
+        self.k = k
+        self.top_n = top_n
+        self.faiss_executor = ThreadPoolExecutor(max_workers=faiss_workers, thread_name_prefix='faiss')
+        self.translation_executor = ThreadPoolExecutor(max_workers=translation_workers, thread_name_prefix='translation')
+        self.index = None
+        self.ids = None
+        self.types = None
+        self.total_weights = None
+        self.snapshot = None
+        self.video_urls = None
+        self.index_source = None
+        self.reload_interval = reload_interval
+        self._reload_task = None
+
+    def _load_index(self):
+        """
+        Загрузка индекса из самого свежего источника вместе с весами видео.
+
+        :return: Кортеж (источник, индекс, ids, types, снимок или None, веса видео, адреса видео или None).
+        """
+        # Из снимка и синхронизированного индекса загружается более свежий
+        source = newest_index_source()
+        if source is not None and source[0] == 'snapshot':
+            # Холодный старт из снимка без обращения к MongoDB
+            snapshot = load_snapshot(source[1])
+            logging.info(f"Loaded snapshot {snapshot.path}.")
+            return (source, snapshot.build_index(), snapshot.ids, snapshot.types, snapshot,
+                    snapshot.total_weights(), snapshot.video_urls())
+        if source is None:
+            # Первый запуск: индекс строится из MongoDB один раз и сохраняется на диск
+            state = sync_faiss_index()
+            source = ('sync', state['version'])
+            logging.info(f"Built Faiss index version {state['version']} from MongoDB.")
+        # Индекс и связи строк читаются с диска, из MongoDB - только изменения после этой версии
+        index, ids, types = load_synced_index(catch_up=True)
+        logging.info(f"Loaded synced Faiss index version {source[1]}.")
+        return source, index, ids, types, None, compute_total_weights(ids, types), None
+
+    def _install_index(self, loaded):
+        # Подмена выполняется в цикле событий без await, запросы видят либо старый индекс, либо новый целиком
+        (self.index_source, self.index, self.ids, self.types, self.snapshot,
+         self.total_weights, self.video_urls) = loaded
+
+    async def start(self):
+        """
+        Загрузка индекса и отображения строк в видео и запуск периодической проверки новой версии.
+        """
+        loop = asyncio.get_running_loop()
+        self._install_index(await loop.run_in_executor(self.faiss_executor, self._load_index))
+        logging.info(f"Search service started with {self.index.get_total_vectors()} vectors.")
+        if self.reload_interval:
+            self._reload_task = asyncio.create_task(self._watch_index())
+
+    async def _watch_index(self):
+        """
+        Перезагрузка индекса при появлении новой версии синхронизации или нового снимка.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                source = await loop.run_in_executor(self.faiss_executor, newest_index_source)
+                if source is None or source == self.index_source:
+                    continue
+                self._install_index(await loop.run_in_executor(self.faiss_executor, self._load_index))
+                logging.info(f"Reloaded index {self.index_source} with {self.index.get_total_vectors()} vectors.")
+            except Exception as e:
+                # Поиск продолжает работать на прежней версии индекса
+                logging.error(f"Failed to reload index: {str(e)}")
+
+    async def search(self, word):
+        """
+        Поиск видео по текстовому запросу.
+
+        :param word: Слово или фраза для поиска.
+        :return: Список словарей {'url', 'video_distance'}, отсортированный по расстоянию.
+        """
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+
+        translated_query = await loop.run_in_executor(self.translation_executor, translate_text, word)
+        logging.debug(f"Search query: {word}, translated: {translated_query}")
+
+        success, vector = await self.encoder.encode_text(translated_query)
+        if not success:
+            raise ValueError("Failed to process text data.")
+        clip_processing_time = time.time() - start_time
+
+        # Запрос выполняется целиком на одной версии индекса, даже если она будет заменена во время ожидания
+        index, ids, types, total_weights, video_urls = \
+            self.index, self.ids, self.types, self.total_weights, self.video_urls
+
+        query_vector = np.array(vector).astype('float32').reshape(1, -1)
+        start_faiss_time = time.time()
+        distances, indices = await loop.run_in_executor(
+            self.faiss_executor, index.search_vectors, query_vector, self.k)
+        faiss_search_time = time.time() - start_faiss_time
+
+        sorted_results = rank_videos(distances[0], indices[0], ids, types, total_weights)[:self.top_n]
+
+        # Один запрос к MongoDB вместо find_one для каждого видео
+        top_ids = [video_id for video_id, _ in sorted_results]
+        if video_urls is not None:
+            urls = video_urls
+        else:
+            urls = {}
+            async for video_doc in self.video_collection.find({'id': {'$in': top_ids}}, {'id': 1, 'url': 1}):
+                urls[video_doc['id']] = video_doc.get('url', '')
+
+        video_results = [{"url": urls.get(video_id, ''), "video_distance": float(total_distance)}
+                         for video_id, total_distance in sorted_results]
+
+        logging.info(f"Query '{word}': CLIP processing time {clip_processing_time:.2f} seconds, "
+                     f"FAISS search time {faiss_search_time:.2f} seconds.")
+        return video_results
+
+    async def close(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+        await self.encoder.close()
+        self.faiss_executor.shutdown(wait=False)
+        self.translation_executor.shutdown(wait=False)
@@ -0,0 +1,293 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from video_download import VideoPrefetcher
+
+# Настройка логирования
+logging.basicConfig(filename='processing.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+manifest_file_path = 'video_description/all_videos.json'
+state_db_path = 'ingestion_state.sqlite'
+vectors_jsonl_path = 'video_vectors.jsonl'
+
+# Статусы видео в хранилище состояния
+PENDING, RUNNING, DONE, FAILED, DEAD = 'pending', 'running', 'done', 'failed', 'dead'
+
+
+class IngestionStateStore:
+    def __init__(self, db_path=state_db_path):
+        """
+        Хранилище состояния пакетной обработки в SQLite.
+
+        Каждое изменение статуса - отдельная транзакция, поэтому после падения процесса
+        обработка продолжается с того же места без перезаписи общего файла результатов.
+        Статистика и ошибки обработки видео хранятся здесь же (вместо statistics_Server_API.json
+        и unprocessed_videos_Server_API.log, в которые одновременно писали бы все процессы).
+
+        :param db_path: Путь к файлу базы SQLite.
+        """
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                description TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                processing_time REAL,
+                statistics TEXT,
+                updated_at REAL
+            )''')
+        # Хранилища, созданные до появления статистики видео
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(videos)')]
+        if 'statistics' not in columns:
+            self.connection.execute('ALTER TABLE videos ADD COLUMN statistics TEXT')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS videos_status ON videos (status, position)')
+        self.connection.commit()
+
+    def load_manifest(self, manifest_path=manifest_file_path):
+        """
+        Добавление видео из манифеста (уже известные видео не изменяются).
+
+        :param manifest_path: JSON вида {video_id: {'url': ..., 'description': ...}}.
+        :return: Количество новых видео.
+        """
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            all_videos = json.load(file)
+        with self.connection:
+            offset = self.connection.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM videos').fetchone()[0]
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO videos (video_id, position, url, description, updated_at) VALUES (?, ?, ?, ?, ?)',
+                ((video_id, offset + position, video['url'], video.get('description'), time.time())
+                 for position, (video_id, video) in enumerate(all_videos.items())))
+            return self.connection.total_changes - before
+
+    def reset_running(self):
+        """
+        Возврат видео, прерванных падением процесса, в очередь.
+        """
+        with self.connection:
+            self.connection.execute('UPDATE videos SET status = ? WHERE status = ?', (PENDING, RUNNING))
+
+    def claim_next(self, limit):
+        """
+        Выбор следующих видео в порядке манифеста с пометкой 'running'.
+
+        :param limit: Максимальное количество видео.
+        :return: Список кортежей (video_id, url, description).
+        """
+        with self.connection:
+            rows = self.connection.execute(
+                'SELECT video_id, url, description FROM videos WHERE status IN (?, ?) AND next_attempt_at <= ? '
+                'ORDER BY position LIMIT ?', (PENDING, FAILED, time.time(), limit)).fetchall()
+            self.connection.executemany('UPDATE videos SET status = ?, updated_at = ? WHERE video_id = ?',
+                                        ((RUNNING, time.time(), row[0]) for row in rows))
+        return rows
+
+    def mark_done(self, video_id, processing_time, statistics=None):
+        with self.connection:
+            self.connection.execute(
+                'UPDATE videos SET status = ?, attempts = attempts + 1, processing_time = ?, last_error = NULL, '
+                'statistics = ?, updated_at = ? WHERE video_id = ?',
+                (DONE, processing_time, json.dumps(statistics) if statistics is not None else None, time.time(),
+                 video_id))
+
+    def mark_failed(self, video_id, error, max_attempts, backoff):
+        """
+        Повтор с экспоненциальной задержкой или перенос в список dead-letter.
+
+        :return: Новый статус видео.
+        """
+        with self.connection:
+            attempts = self.connection.execute('SELECT attempts FROM videos WHERE video_id = ?',
+                                               (video_id,)).fetchone()[0] + 1
+            status = DEAD if attempts >= max_attempts else FAILED
+            self.connection.execute(
+                'UPDATE videos SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? '
+                'WHERE video_id = ?',
+                (status, attempts, error, time.time() + backoff * 2 ** (attempts - 1), time.time(), video_id))
+        return status
+
+    def next_retry_at(self):
+        return self.connection.execute('SELECT MIN(next_attempt_at) FROM videos WHERE status = ?',
+                                       (FAILED,)).fetchone()[0]
+
+    def dead_letters(self):
+        """
+        Видео, исчерпавшие попытки (замена unprocessed_videos.log).
+
+        :return: Список кортежей (video_id, url, attempts, last_error).
+        """
+        return self.connection.execute('SELECT video_id, url, attempts, last_error FROM videos WHERE status = ? '
+                                       'ORDER BY position', (DEAD,)).fetchall()
+
+    def requeue_dead(self):
+        with self.connection:
+            return self.connection.execute(
+                'UPDATE videos SET status = ?, attempts = 0, next_attempt_at = 0 WHERE status = ?',
+                (PENDING, DEAD)).rowcount
+
+    def video_statistics(self, video_id):
+        row = self.connection.execute('SELECT statistics FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def counts(self):
+        return dict(self.connection.execute('SELECT status, COUNT(*) FROM videos GROUP BY status').fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+# Состояние процесса-обработчика: модели загружаются один раз при старте процесса
+_worker_mode = None
+
+
+def _init_worker(mode):
+    global _worker_mode
+    _worker_mode = mode
+    if mode == 'full':
+        import HANDLE_ONE_with_MONGO  # noqa: F401 - загрузка spaCy, Whisper, EasyOCR и MarianMT
+
+
+def _process_video(video_id, video_url, description, video_path):
+    start_time = time.time()
+    if _worker_mode == 'full':
+        # Без общих JSON и журнала: статистика и ошибки записываются в хранилище состояния
+        from HANDLE_ONE_with_MONGO import handle_video
+        success, statistics = handle_video(video_url, description, video_path=video_path)
+        if not success:
+            raise RuntimeError(f"Video was not processed, stage errors: {statistics['stage_errors']}")
+        return video_id, None, time.time() - start_time, statistics
+
+    from download_video_by_url_and_make_frames import create_thumbnails_for_video_message
+    from HANDLE_ONE_only_video import process_only_video_data
+    from frame_dedup import dedupe_frames
+    try:
+        frames, _, _, _ = create_thumbnails_for_video_message(video_id, video_url, "frames", video_path=video_path)
+    finally:
+        os.unlink(video_path)
+    frames, frames_dropped = dedupe_frames(frames)
+    success, image_vectors, _ = process_only_video_data(video_id, frames)
+    if not success or image_vectors is None:
+        raise RuntimeError("Encoder did not return image vectors")
+    return video_id, {"url": video_url, "vectors": image_vectors}, time.time() - start_time, \
+        {"frames_dropped": frames_dropped}
+
+
+def run_batch_ingestion(manifest_path=manifest_file_path, mode='full', workers=2, max_attempts=3, backoff=30.0,
+                        db_path=state_db_path, output_path=vectors_jsonl_path, prefetch=2):
+    """
+    Пакетная обработка видео из манифеста пулом долгоживущих процессов.
+
+    Скачивание выполняется в основном процессе с опережением: пока обработчики заняты,
+    следующие видео уже скачиваются на диск.
+
+    :param manifest_path: Путь к манифесту видео.
+    :param mode: 'full' - полная обработка с записью в MongoDB, 'video' - только векторы кадров в JSONL.
+    :param workers: Количество процессов-обработчиков.
+    :param max_attempts: Число попыток до переноса видео в dead-letter.
+    :param backoff: Базовая задержка повтора, секунды (удваивается с каждой попыткой).
+    :param db_path: Путь к хранилищу состояния.
+    :param output_path: JSONL с векторами (режим 'video'), дописывается по одной строке на видео.
+    :param prefetch: Количество видео, скачиваемых заранее.
+    :return: Количество видео по статусам.
+    """
+    store = IngestionStateStore(db_path)
+    store.reset_running()
+    added = store.load_manifest(manifest_path)
+    logging.info(f"Batch ingestion: {added} new videos from {manifest_path}, state {store.counts()}.")
+
+    # spawn: процессы не наследуют соединения и потоки родителя
+    context = multiprocessing.get_context('spawn')
+    prefetcher = VideoPrefetcher(depth=prefetch)
+    downloads = {}
+    in_flight = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(mode,)) as executor, open(output_path, 'a', encoding='utf-8') as output:
+        while True:
+            for row in store.claim_next(max(0, workers + prefetch - len(downloads) - len(in_flight))):
+                downloads[prefetcher.submit(row[0], row[1])] = row
+
+            if not downloads and not in_flight:
+                retry_at = store.next_retry_at()
+                if retry_at is None:
+                    break
+                time.sleep(max(0.0, retry_at - time.time()))
+                continue
+
+            done, _ = wait(set(downloads) | set(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    video_id, video_url, description = downloads.pop(future)
+                    try:
+                        video_path = future.result()
+                    except Exception as e:
+                        status = store.mark_failed(video_id, f"Download failed: {str(e)}", max_attempts, backoff)
+                        log_message = f"Video {video_id} download failed ({status}): {str(e)}"
+                        print(log_message)
+                        logging.warning(log_message)
+                        continue
+                    in_flight[executor.submit(_process_video, video_id, video_url, description, video_path)] = \
+                        (video_id, video_path)
+                    continue
+
+                video_id, video_path = in_flight.pop(future)
+                # Обработчик удаляет видео сам, при сбое файл может остаться
+                if os.path.exists(video_path):
+                    os.unlink(video_path)
+                try:
+                    _, vectors, processing_time, statistics = future.result()
+                except Exception as e:
+                    status = store.mark_failed(video_id, str(e), max_attempts, backoff)
+                    log_message = f"Video {video_id} failed ({status}): {str(e)}"
+                    print(log_message)
+                    logging.warning(log_message)
+                    continue
+                if vectors is not None:
+                    output.write(json.dumps({"video_id": video_id, **vectors}) + "\n")
+                    output.flush()
+                store.mark_done(video_id, processing_time, statistics)
+                log_message = f"Successfully processed {video_id} in {processing_time:.2f} seconds."
+                print(log_message)
+                logging.info(log_message)
+
+    prefetcher.close()
+    counts = store.counts()
+    logging.info(f"Batch ingestion finished: {counts}, dead letters: {len(store.dead_letters())}.")
+    store.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетная обработка видео с возобновлением")
+    parser.add_argument('--manifest', default=manifest_file_path)
+    parser.add_argument('--mode', choices=['full', 'video'], default='full')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=30.0)
+    parser.add_argument('--prefetch', type=int, default=2, help="Количество видео, скачиваемых заранее")
+    parser.add_argument('--dead-letters', action='store_true', help="Показать видео, исчерпавшие попытки")
+    parser.add_argument('--requeue-dead', action='store_true', help="Вернуть dead-letter видео в очередь")
+    args = parser.parse_args()
+
+    if args.dead_letters or args.requeue_dead:
+        state_store = IngestionStateStore()
+        if args.requeue_dead:
+            print(f"Requeued {state_store.requeue_dead()} videos.")
+        for row in state_store.dead_letters():
+            print(*row, sep='\t')
+        state_store.close()
+    else:
+        print(run_batch_ingestion(args.manifest, mode=args.mode, workers=args.workers,
+                                  max_attempts=args.max_attempts, backoff=args.backoff, prefetch=args.prefetch))
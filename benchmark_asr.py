@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import re
+import time
+
+from asr_engines import load_asr_engine
+from whisper_extraction import load_audio, sample_rate, transcribe_speech, route_language
+
+media_extensions = ('.mp4', '.mkv', '.webm', '.mov', '.wav', '.mp3', '.m4a', '.flac', '.ogg')
+
+
+def normalize_words(text):
+    return re.sub(r'[^\w\s]', ' ', text.lower().replace('ё', 'е')).split()
+
+
+def word_errors(reference, hypothesis):
+    """
+    Расстояние Левенштейна между последовательностями слов.
+
+    :return: Кортеж (число ошибок, число слов эталона).
+    """
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1], len(reference)
+
+
+def load_sample_set(sample_dir, reference_suffix='.txt'):
+    """
+    Набор примеров: файлы аудио/видео и эталонные расшифровки с тем же именем и суффиксом reference_suffix
+    (.txt - расшифровка на языке речи, .en.txt - английский перевод для проверки с --routing).
+    """
+    samples = []
+    for filename in sorted(os.listdir(sample_dir)):
+        name, extension = os.path.splitext(filename)
+        reference_path = os.path.join(sample_dir, f'{name}{reference_suffix}')
+        if extension.lower() in media_extensions and os.path.exists(reference_path):
+            with open(reference_path, 'r', encoding='utf-8') as file:
+                samples.append((os.path.join(sample_dir, filename), file.read()))
+    return samples
+
+
+def benchmark_engine(engine, samples, use_vad=False, routing=False):
+    total_audio, total_time, total_errors, total_words = 0.0, 0.0, 0, 0
+    results = []
+    for path, reference, audio in samples:
+        duration = len(audio) / sample_rate
+        start_time = time.time()
+        if use_vad:
+            text, _ = transcribe_speech(audio, engine, workers=1, routing=routing)
+        else:
+            language, task = route_language(engine, audio) if routing else ('ru', 'transcribe')
+            segments, _ = engine.transcribe(audio, language=language, task=task)
+            text = ''.join(segment['text'] for segment in segments)
+        elapsed = time.time() - start_time
+        errors, words = word_errors(reference, text or '')
+        total_audio += duration
+        total_time += elapsed
+        total_errors += errors
+        total_words += words
+        results.append({'file': path, 'duration': duration, 'time': elapsed,
+                        'rtf': elapsed / duration if duration else None, 'wer': errors / words if words else None})
+    return {'engine': engine.version, 'rtf': total_time / total_audio if total_audio else None,
+            'wer': total_errors / total_words if total_words else None, 'files': results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение движков распознавания речи: RTF и WER")
+    parser.add_argument('sample_dir', help="Каталог с аудио/видео и эталонными расшифровками .txt")
+    parser.add_argument('--engines', nargs='+', default=['whisper', 'faster-whisper'])
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--vad', action='store_true', help="Распознавать только фрагменты речи")
+    parser.add_argument('--routing', action='store_true',
+                        help="Выбор задачи по языку речи (как при обработке); эталоны - английские файлы .en.txt")
+    parser.add_argument('--output', default=None, help="Сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    reference_suffix = '.en.txt' if args.routing else '.txt'
+    samples = [(path, reference, load_audio(path))
+               for path, reference in load_sample_set(args.sample_dir, reference_suffix)]
+    if not samples:
+        raise SystemExit(f"В каталоге {args.sample_dir} нет примеров с эталонными расшифровками")
+    print(f"Loaded {len(samples)} samples, {sum(len(audio) for _, _, audio in samples) / sample_rate:.1f} seconds")
+
+    reports = []
+    for engine_name in args.engines:
+        engine = load_asr_engine(engine_name, args.model)
+        report = benchmark_engine(engine, samples, use_vad=args.vad, routing=args.routing)
+        reports.append(report)
+        print(f"{report['engine']}: RTF {report['rtf']:.3f}, WER {report['wer']:.1%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, indent=4, ensure_ascii=False)
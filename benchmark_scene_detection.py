@@ -0,0 +1,62 @@
+import argparse
+import json
+import time
+
+from download_video_by_url_and_make_frames import download_video, split_scenes, choose_scenes
+from keyframe_extraction import probe_video
+from scene_detection import detect_scenes
+
+
+def select_scenes(scenes, duration, num_of_thumbnails=15):
+    # Тот же отбор сцен, что в create_thumbnails_for_video_message
+    if len(scenes) > num_of_thumbnails:
+        start_scenes, middle_scenes, end_scenes = split_scenes(scenes, duration)
+        return choose_scenes(start_scenes, end_scenes, middle_scenes, num_of_thumbnails)
+    return scenes
+
+
+def match_ratio(reference, candidate, tolerance):
+    """
+    Доля выбранных моментов эталона, для которых в быстром режиме есть момент не дальше tolerance секунд.
+    """
+    if not reference:
+        return 1.0
+    matched = sum(1 for time_ref in reference if any(abs(time_ref - time_fast) <= tolerance for time_fast in candidate))
+    return matched / len(reference)
+
+
+def benchmark_video(video_path, threshold=7.5, tolerance=0.5, fast_threshold_factor=None):
+    duration = probe_video(video_path).duration
+    report = {'video_path': video_path, 'duration': duration}
+    selected = {}
+    for mode, fast in (('full', False), ('fast', True)):
+        start_time = time.time()
+        scenes = detect_scenes(video_path, threshold=threshold, fast=fast, threshold_factor=fast_threshold_factor)
+        elapsed = time.time() - start_time
+        selected[mode] = [scene_start.get_seconds() for scene_start, _ in select_scenes(scenes, duration)]
+        report[mode] = {'time': elapsed, 'realtime_factor': elapsed / duration if duration else None,
+                        'scenes': len(scenes), 'selected': len(selected[mode])}
+    report['speedup'] = report['full']['time'] / report['fast']['time'] if report['fast']['time'] else None
+    report['selected_match'] = match_ratio(selected['full'], selected['fast'], tolerance)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение обычного и быстрого определения сцен")
+    parser.add_argument('videos', nargs='+', help="Пути к видео или ссылки на видео")
+    parser.add_argument('--threshold', type=float, default=7.5)
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Допуск совпадения моментов, секунды")
+    parser.add_argument('--fast-threshold-factor', type=float, default=None,
+                        help="Множитель порога быстрого режима (по умолчанию SCENE_FAST_THRESHOLD_FACTOR)")
+    args = parser.parse_args()
+
+    reports = []
+    for i, video in enumerate(args.videos):
+        video_path = download_video(f'benchmark_{i}', video) if video.startswith('http') else video
+        report = benchmark_video(video_path, threshold=args.threshold, tolerance=args.tolerance,
+                                 fast_threshold_factor=args.fast_threshold_factor)
+        reports.append(report)
+        print(f"{video}: full {report['full']['time']:.2f}s (RTF {report['full']['realtime_factor']:.3f}), "
+              f"fast {report['fast']['time']:.2f}s (RTF {report['fast']['realtime_factor']:.3f}), "
+              f"speedup x{report['speedup']:.1f}, selected match {report['selected_match']:.0%}")
+    print(json.dumps(reports, indent=4))
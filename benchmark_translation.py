@@ -0,0 +1,84 @@
+import argparse
+import json
+import re
+import time
+
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from translation import model_name, translate, translate_batch
+from translation_runtime import load_translator
+
+# Фразы по умолчанию (ключевые слова описаний видео)
+default_phrases = [
+    "натуральный", "готовят", "заведения", "пахлавы миндаля грецкого", "турецкой", "шефповар", "осталась",
+    "настоящей турецкой пахлавы", "подарочные наборы", "готовые наборы", "поесть", "в восторге", "видов",
+    "рецепт домашнего хлеба", "обзор нового телефона", "прогулка по вечерней москве", "тренировка дома без инвентаря",
+    "как выучить английский язык быстро", "смешные кошки", "ремонт квартиры своими руками",
+]
+
+
+def load_phrases(path):
+    """
+    Фразы из текстового файла: по одной на строку или через запятую.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return [phrase.strip() for line in file for phrase in line.split(',') if phrase.strip()]
+
+
+def normalize_words(text):
+    return re.sub(r'[^\w\s]', ' ', text.lower()).split()
+
+
+def word_overlap(reference, hypothesis):
+    reference, hypothesis = set(normalize_words(reference)), set(normalize_words(hypothesis))
+    if not reference and not hypothesis:
+        return 1.0
+    return len(reference & hypothesis) / len(reference | hypothesis)
+
+
+def benchmark_runtime(runtime, phrases, references, batch_size):
+    translator = load_translator(model_name, runtime)
+    # Прогрев: первый вызов включает инициализацию
+    translate_batch(phrases[:1], translator, batch_size)
+    start_time = time.time()
+    translations = translate_batch(phrases, translator, batch_size)
+    elapsed = time.time() - start_time
+    exact = sum(translation == reference for translation, reference in zip(translations, references))
+    overlap = sum(word_overlap(reference, translation) for translation, reference in zip(translations, references))
+    return {'runtime': runtime, 'time': elapsed, 'phrases_per_sec': len(phrases) / elapsed if elapsed else None,
+            'exact_match': exact / len(phrases), 'word_overlap': overlap / len(phrases),
+            'differences': [{'phrase': phrase, 'reference': reference, 'translation': translation}
+                            for phrase, reference, translation in zip(phrases, references, translations)
+                            if translation != reference]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение сред выполнения перевода: скорость и совпадение "
+                                                 "с эталонным переводом по одной фразе")
+    parser.add_argument('--phrases', default=None, help="Файл с фразами (по одной на строку или через запятую)")
+    parser.add_argument('--runtimes', nargs='+', default=['torch', 'ctranslate2'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default=None, help="Сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    phrases = load_phrases(args.phrases) if args.phrases else default_phrases
+
+    # Эталон - исходный перевод по одной фразе в PyTorch
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    start_time = time.time()
+    references = [translate(phrase, model, tokenizer) for phrase in phrases]
+    reference_time = time.time() - start_time
+    print(f"reference: {len(phrases)} phrases, {reference_time:.2f} seconds, "
+          f"{len(phrases) / reference_time:.1f} phrases/sec")
+
+    reports = [{'runtime': 'reference', 'time': reference_time}]
+    for runtime in args.runtimes:
+        report = benchmark_runtime(runtime, phrases, references, args.batch_size)
+        reports.append(report)
+        print(f"{runtime}: {report['time']:.2f} seconds ({reference_time / report['time']:.1f}x), "
+              f"exact match {report['exact_match']:.1%}, word overlap {report['word_overlap']:.1%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, indent=4, ensure_ascii=False)
@@ -1,73 +1,107 @@
-import os
 import logging
 import numpy as np
-from pymongo import MongoClient
+from mongo_connection import get_collection, default_db_name
 from faiss_module import FaissIndex  # Ваш класс FaissIndex
+from vector_codec import decode_document_vectors, vector_document_projection, vector_count_pipeline, \
+    text_vector_fields
 
 # Настройка логирования
 logging.basicConfig(filename='processing.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(message)s')
 
 # Параметры базы данных
-db_name = 'video_database'
+db_name = default_db_name  # MONGO_DB
 collection_name = 'videos'
 
-# Путь к файлу для записи и загрузки индекса
-index_file_path = 'combined_vectors.faiss'
+# Функция для подсчета векторов без их чтения
+def count_vectors_in_db(collection):
+    result = list(collection.aggregate(vector_count_pipeline))
+    if not result:
+        return 0, None
+    return result[0]['rows'], result[0]['dim']
 
-# Функция для загрузки векторов из MongoDB
-def load_vectors_from_db():
-    client = MongoClient("mongodb://mongo:27017/")
-    db = client[db_name]
-    collection = db[collection_name]
+# Функция для определения размерности по первому документу с векторами (старый формат не хранит dim)
+def find_vector_dimension(collection):
+    query = {'$or': [{'video_vectors.0': {'$exists': True}},
+                     *[{field: {'$ne': None}} for field, _ in text_vector_fields]]}
+    document = collection.find_one(query, vector_document_projection)
+    if document is None:
+        raise ValueError("В коллекции нет документов с векторами для определения размерности индекса")
+    return decode_document_vectors(document)[0].shape[1]
 
-    vectors = []
-    ids = []
-    types = []
+# Потоковое построение индекса с ограниченной памятью
+def build_faiss_index_streaming(document_rows, batch_size=1000, chunk_size=50000):
+    """
+    Построение индекса с номерами строк потоком из MongoDB без промежуточных списков и np.vstack.
 
-    cursor = collection.find({})
-    for document in cursor:
-        video_id = document['id']
-        if document['video_vectors']:
-            for vec in document['video_vectors']:
-                vectors.append(np.frombuffer(vec, dtype='float32'))
-                ids.append(video_id)
-                types.append('video')
-        if document.get('description_vector') is not None:
-            vectors.append(np.frombuffer(document['description_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('description')
-        if document.get('subtitle_vector') is not None:
-            vectors.append(np.frombuffer(document['subtitle_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('subtitle')
-        if document.get('audio_vector') is not None:
-            vectors.append(np.frombuffer(document['audio_vector'], dtype='float32'))
-            ids.append(video_id)
-            types.append('audio')
-
-    return vectors, ids, types
+    Векторы копируются в буфер float32 на одну пачку и добавляются в IndexIDMap2 пачками по chunk_size
+    строк. Связь строк с видео хранится в заранее выделенных массивах numpy (код видео и код типа
+    на строку), а не в словаре с записью на каждую строку.
 
-# Функция для создания или загрузки Faiss индекса
-def create_faiss_index():
-    try:
-        vectors, ids, types = load_vectors_from_db()
-        logging.info("Successfully loaded vectors from MongoDB.")
-    except Exception as e:
-        logging.error(f"Failed to load vectors from MongoDB: {str(e)}")
-        raise
+    :param document_rows: Функция документ -> номер первой строки документа в индексе.
+    :param batch_size: Размер пачки курсора MongoDB.
+    :param chunk_size: Количество строк, добавляемых в FAISS за один вызов.
+    :return: Кортеж (FaissIndex, номера строк int64, video_id строк, типы векторов строк).
+    """
+    collection = get_collection(collection_name, db_name)
+    total_rows, d = count_vectors_in_db(collection)
+    if total_rows == 0:
+        raise ValueError("В коллекции нет векторов для построения индекса")
+    if d is None:
+        # Старый формат документов не хранит размерность
+        d = find_vector_dimension(collection)
+    logging.info(f"Streaming {total_rows} vectors of dimension {d}.")
 
-    # Размерность векторов
-    d = len(vectors[0])
-    logging.info(f"Vector dimension: {d}")
+    index = FaissIndex(d, index_type='IDMapFlatL2')
+    buffer = np.empty((min(chunk_size, total_rows), d), dtype='float32')
+    buffer_ids = np.empty(len(buffer), dtype='int64')
+    row_ids = np.empty(total_rows, dtype='int64')
+    row_video = np.empty(total_rows, dtype='int32')
+    row_type = np.empty(total_rows, dtype='int8')
+    video_ids = []
+    type_codes = {}
+    filled = 0  # Строк прочитано
+    buffered = 0  # Строк в буфере, еще не добавленных в индекс
 
-    # Создание или загрузка Faiss индекса
-    index = FaissIndex(d, index_type='FlatL2')
+    def flush():
+        nonlocal buffered
+        index.add_vectors_with_ids(buffer[:buffered], buffer_ids[:buffered])
+        buffered = 0
+        logging.info(f"Added {filled}/{len(row_ids)} vectors to Faiss index ({filled / len(row_ids):.0%}).")
 
+    cursor = collection.find({}, vector_document_projection, batch_size=batch_size)
+    for document in cursor:
+        document_vectors, document_types = decode_document_vectors(document)
+        count = len(document_types)
+        if count == 0:
+            continue
+        index_start = document_rows(document)
+        if filled + count > len(row_ids):
+            # Документы, добавленные после подсчета, тоже попадают в индекс
+            size = max(filled + count, len(row_ids) + chunk_size)
+            row_ids, row_video, row_type = (np.resize(array, size) for array in (row_ids, row_video, row_type))
+        row_ids[filled:filled + count] = np.arange(index_start, index_start + count)
+        row_video[filled:filled + count] = len(video_ids)
+        row_type[filled:filled + count] = [type_codes.setdefault(vector_type, len(type_codes))
+                                           for vector_type in document_types]
+        video_ids.append(document['id'])
 
-    # Добавление векторов и сохранение индекса
-    index.add_vectors(np.vstack(vectors))
-    index.save_index(index_file_path)
-    logging.info("Created and saved new Faiss index.")
+        position = 0
+        while position < count:
+            step = min(count - position, len(buffer) - buffered)
+            buffer[buffered:buffered + step] = document_vectors[position:position + step]
+            buffer_ids[buffered:buffered + step] = np.arange(index_start + position, index_start + position + step)
+            buffered += step
+            position += step
+            filled += step
+            if buffered == len(buffer):
+                flush()
+    cursor.close()
+    if buffered:
+        flush()
+    if filled == 0:
+        raise ValueError("В коллекции нет векторов для построения индекса")
 
-if __name__ == "__main__":
-    create_faiss_index()
+    # Строковые массивы фиксированной ширины строятся по кодам один раз
+    type_values = np.array(list(type_codes), dtype=str)
+    return (index, row_ids[:filled], np.array(video_ids, dtype=str)[row_video[:filled]],
+            type_values[row_type[:filled]])
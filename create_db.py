@@ -1,29 +1,145 @@
-from pymongo import MongoClient, ASCENDING, errors
-from bson.binary import Binary
-import pickle
+from pymongo import ASCENDING, ReturnDocument, errors
+
+from mongo_connection import get_client, default_db_name
+from vector_codec import encode_video_document, count_document_vectors
 
 class VideoIndex:
-    def __init__(self, db_name, collection_name, index_mapping_collection_name):
+    def __init__(self, db_name, collection_name, index_mapping_collection_name, vector_dtype='float32'):
         """
         Инициализация индекса для видео в MongoDB.
 
+        Использует общий пул соединений mongo_connection; подключение и создание индексов
+        коллекций откладываются до первой записи.
+
         :param db_name: Название базы данных.
         :param collection_name: Название коллекции.
         :param index_mapping_collection_name: Название коллекции для хранения связи индексов и идентификаторов видео.
+        :param vector_dtype: Тип хранения векторов ('float32' или 'float16').
+        """
+        self.vector_dtype = vector_dtype
+        self.client = get_client()
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+        self.index_mapping_collection = self.db[index_mapping_collection_name]
+        # Счетчики для выделения глобальных номеров строк индекса
+        self.counters_collection = self.db['counters']
+        # Записи об удаленных видео для инкрементальной синхронизации FAISS
+        self.tombstones_collection = self.db['video_tombstones']
+        self._indexes_ready = False
+
+    def ensure_indexes(self):
+        """
+        Создание индексов коллекций (один раз на экземпляр).
         """
+        if self._indexes_ready:
+            return
         try:
-            self.client = MongoClient("mongodb://mongo:27017/")
-            self.db = self.client[db_name]
-            self.collection = self.db[collection_name]
-            self.index_mapping_collection = self.db[index_mapping_collection_name]
             self.collection.create_index([('id', ASCENDING)], unique=True)
             self.index_mapping_collection.create_index([('index', ASCENDING)], unique=True)
+            self.collection.create_index([('index_start', ASCENDING)])
+            self.tombstones_collection.create_index([('seq', ASCENDING)], unique=True)
         except errors.ServerSelectionTimeoutError as e:
             print(f"Ошибка подключения к MongoDB: {e}")
             raise
         except errors.CollectionInvalid as e:
             print(f"Ошибка создания коллекции: {e}")
             raise
+        self._indexes_ready = True
+
+    def _next_sequence(self, name, count):
+        """
+        Атомарное выделение диапазона номеров из счетчика.
+
+        :param name: Имя счетчика.
+        :param count: Количество номеров.
+        :return: Первый номер выделенного диапазона [start, start + count).
+        """
+        counter = self.counters_collection.find_one_and_update(
+            {'_id': name},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq'] - count
+
+    def allocate_indexes(self, count):
+        """
+        Атомарное выделение диапазона глобальных номеров строк индекса.
+
+        :param count: Количество номеров.
+        :return: Первый номер выделенного диапазона [start, start + count).
+        """
+        return self._next_sequence(self.index_mapping_collection.name, count)
+
+    @staticmethod
+    def _build_mappings(video_id, index_start, video_vectors, description_vector, subtitle_vector, audio_vector):
+        """
+        Формирование связей строк индекса с видео в порядке хранения векторов.
+
+        :return: Список документов для коллекции связей.
+        """
+        vector_types = ['video'] * len(video_vectors)
+        if description_vector is not None:
+            vector_types.append('description')
+        if subtitle_vector is not None:
+            vector_types.append('subtitle')
+        if audio_vector is not None:
+            vector_types.append('audio')
+        return [{'index': index_start + offset, 'video_id': video_id, 'vector_type': vector_type}
+                for offset, vector_type in enumerate(vector_types)]
+
+    def add_videos(self, videos):
+        """
+        Пакетное добавление видео и их векторов в коллекцию.
+
+        Номера строк выделяются одним запросом к счетчику, документы и связи записываются
+        через insert_many с ordered=False, поэтому пачка видео занимает несколько обращений к базе.
+
+        :param videos: Список кортежей (video_id, video_vectors, description_vector, subtitle_vector, audio_vector).
+        :return: Список идентификаторов добавленных видео (дубликаты пропускаются).
+        """
+        videos = [(video_id, video_vectors or [], description_vector, subtitle_vector, audio_vector)
+                  for video_id, video_vectors, description_vector, subtitle_vector, audio_vector in videos]
+        if not videos:
+            return []
+        self.ensure_indexes()
+
+        rows_per_video = [len(video_vectors) + sum(vec is not None for vec in (description_vector, subtitle_vector, audio_vector))
+                          for _, video_vectors, description_vector, subtitle_vector, audio_vector in videos]
+        try:
+            index_start = self.allocate_indexes(sum(rows_per_video))
+
+            documents = []
+            mappings = []
+            for (video_id, video_vectors, description_vector, subtitle_vector, audio_vector), rows in zip(videos, rows_per_video):
+                document = encode_video_document(video_id, video_vectors, description_vector, subtitle_vector,
+                                                 audio_vector, dtype=self.vector_dtype)
+                document['index_start'] = index_start
+                documents.append(document)
+                mappings.append(self._build_mappings(video_id, index_start, video_vectors, description_vector,
+                                                     subtitle_vector, audio_vector))
+                index_start += rows
+
+            duplicates = set()
+            try:
+                self.collection.insert_many(documents, ordered=False)
+            except errors.BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    if error.get('code') != 11000:
+                        raise
+                    duplicates.add(error['index'])
+                    print(f"Дублирующийся ключ: {videos[error['index']][0]}")
+
+            # Связи записываются только для действительно добавленных видео
+            added_mappings = [mapping for position, video_mappings in enumerate(mappings) if position not in duplicates
+                              for mapping in video_mappings]
+            if added_mappings:
+                self.index_mapping_collection.insert_many(added_mappings, ordered=False)
+        except errors.PyMongoError as e:
+            print(f"Ошибка при добавлении видео: {e}")
+            raise
+
+        return [video[0] for position, video in enumerate(videos) if position not in duplicates]
 
     def add_video(self, video_id, video_vectors, description_vector, subtitle_vector, audio_vector):
         """
@@ -35,29 +151,7 @@ class VideoIndex:
         :param subtitle_vector: Вектор для субтитров.
         :param audio_vector: Вектор для аудио.
         """
-        document = {
-            'id': video_id,
-            'video_vectors': [Binary(pickle.dumps(vec, protocol=2)) for vec in video_vectors],
-            'description_vector': Binary(pickle.dumps(description_vector, protocol=2)) if description_vector is not None else None,
-            'subtitle_vector': Binary(pickle.dumps(subtitle_vector, protocol=2)) if subtitle_vector is not None else None,
-            'audio_vector': Binary(pickle.dumps(audio_vector, protocol=2)) if audio_vector is not None else None
-        }
-        try:
-            self.collection.insert_one(document)
-            # Сохранение связи индексов и идентификаторов видео
-            for idx, vec in enumerate(video_vectors):
-                self.index_mapping_collection.insert_one({'index': idx, 'video_id': video_id, 'vector_type': 'video'})
-            if description_vector is not None:
-                self.index_mapping_collection.insert_one({'index': len(video_vectors), 'video_id': video_id, 'vector_type': 'description'})
-            if subtitle_vector is not None:
-                self.index_mapping_collection.insert_one({'index': len(video_vectors) + 1, 'video_id': video_id, 'vector_type': 'subtitle'})
-            if audio_vector is not None:
-                self.index_mapping_collection.insert_one({'index': len(video_vectors) + 2, 'video_id': video_id, 'vector_type': 'audio'})
-        except errors.DuplicateKeyError:
-            print(f"Дублирующийся ключ: {video_id}")
-        except errors.PyMongoError as e:
-            print(f"Ошибка при добавлении видео: {e}")
-            raise
+        self.add_videos([(video_id, video_vectors, description_vector, subtitle_vector, audio_vector)])
 
     def remove_video(self, video_id):
         """
@@ -65,8 +159,21 @@ class VideoIndex:
 
         :param video_id: Идентификатор видео для удаления.
         """
+        self.ensure_indexes()
         try:
-            self.collection.delete_one({'id': video_id})
+            document = self.collection.find_one({'id': video_id})
+            if document is not None:
+                # Запись об удалении (ее читает инкрементальная синхронизация FAISS) создается до удаления
+                # документа: при сбое между двумя записями видео останется в базе, но не останется в индексе
+                # без записи об удалении. Повторное применение записи безопасно (строки сверяются со связями)
+                self.tombstones_collection.insert_one({
+                    'seq': self._next_sequence(self.tombstones_collection.name, 1),
+                    'video_id': video_id,
+                    'index_start': document.get('index_start'),
+                    'rows': count_document_vectors(document)
+                })
+                # Удаляется именно прочитанная версия документа
+                self.collection.delete_one({'_id': document['_id'], 'index_start': document.get('index_start')})
             self.index_mapping_collection.delete_many({'video_id': video_id})
         except errors.PyMongoError as e:
             print(f"Ошибка при удалении видео с id {video_id}: {e}")
@@ -92,8 +199,21 @@ class VideoIndex:
     def close(self):
         """
         Закрытие соединения с базой данных.
+
+        Клиент общий для процесса, поэтому закрывается через mongo_connection.close_clients().
         """
-        self.client.close()
+        pass
+
+
+_video_index = None
+
 
-# Пример использования класса VideoIndex
-video_index = VideoIndex(db_name="video_database", collection_name="videos", index_mapping_collection_name="index_mappings")
+def get_video_index():
+    """
+    Общий для процесса экземпляр VideoIndex (создается при первом обращении, а не при импорте).
+    """
+    global _video_index
+    if _video_index is None:
+        _video_index = VideoIndex(db_name=default_db_name, collection_name="videos",
+                                  index_mapping_collection_name="index_mappings")
+    return _video_index
@@ -1,37 +1,54 @@
 import os
 import subprocess
-import tempfile
 from io import BytesIO
 from dataclasses import dataclass
-import requests
-from scenedetect import detect, ContentDetector, FrameTimecode
+from video_download import download_video_stream
+from keyframe_extraction import probe_video, extract_keyframes_jpeg
+from scene_detection import detect_scenes, fast_mode_default
+from scenedetect import FrameTimecode
 import math
 
+# Отладочный режим: дополнительно сохранять ключевые кадры в output_folder
+save_frames_to_disk = os.environ.get('SAVE_FRAMES_TO_DISK', '0') == '1'
+
 @dataclass
 class VideoFrame:
     video_url: str
     file: BytesIO
 
+def frames_to_multipart(video_id: str, frames: list[VideoFrame]) -> list[tuple]:
+    # Кадры из памяти в формате files для requests.post (поле 'images' сервиса кодирования)
+    return [('images', (f'key_frame_{video_id}_{i:03d}.jpg', frame.file.getvalue(), 'image/jpeg'))
+            for i, frame in enumerate(frames)]
+
+def download_video(video_id: str, video_url: str) -> str:
+    # Потоковое скачивание на диск с продолжением по Range (см. video_download.py)
+    video_path = download_video_stream(video_id, video_url)
+    print(video_path)
+    return video_path
+
 def create_thumbnails_for_video_message(
         video_id: str,
         video_url: str,
         output_folder: str,
         frame_change_threshold: float = 7.5,
-        num_of_thumbnails: int = 15
+        num_of_thumbnails: int = 15,
+        video_path: str | None = None,
+        fast_scene_detection: bool = fast_mode_default,
+        save_to_disk: bool = save_frames_to_disk
 ) -> tuple[list[VideoFrame], float, int, str]:
     frames: list[VideoFrame] = []
-    video_data = BytesIO(requests.get(video_url).content)
-    print(video_data)
+    # Видео может быть уже скачано отдельным этапом
+    if video_path is None:
+        video_path = download_video(video_id, video_url)
 
-    with tempfile.NamedTemporaryFile(delete=False, prefix=f"{video_id}_", suffix='.mp4') as tmp_file:
-        tmp_file.write(video_data.getvalue())
-        video_path = tmp_file.name
-        print(video_path)
-
-    scenes = detect(video_path, ContentDetector(threshold=frame_change_threshold))
+    # Быстрый режим анализирует уменьшенные кадры с пропуском (см. scene_detection.py)
+    scenes = detect_scenes(video_path, threshold=frame_change_threshold, fast=fast_scene_detection)
     print(scenes)
     print(len(scenes))
-    duration = get_video_duration(video_path)
+    # Метаданные видео получаются одним вызовом ffprobe
+    metadata = probe_video(video_path)
+    duration = metadata.duration
     print(duration)
 
     selected_scenes = scenes
@@ -45,7 +62,7 @@ def create_thumbnails_for_video_message(
     # Добавление первого и последнего кадра, если сцены не были обнаружены
     if not scenes:
         print("Не обнаружено изменений в сценах")
-        video_fps = get_video_fps(video_path)
+        video_fps = metadata.fps
         first_scene = FrameTimecode(timecode='00:00:00', fps=video_fps)
         scenes.append((first_scene, first_scene))
         last_timecode = FrameTimecode(timecode=f'{max(0, int(duration - 0.1)):.1f}', fps=video_fps)
@@ -54,34 +71,25 @@ def create_thumbnails_for_video_message(
         print(scenes)
         selected_scenes = scenes
 
-    os.makedirs(output_folder, exist_ok=True)
-    saved_frames_count = 0  # Подсчет успешно сохраненных кадров
-
-    # Обработка и сохранение каждого кадра из selected_scenes
-    for i, (scene_start, _) in enumerate(selected_scenes):
-        output_path = os.path.join(output_folder, f'key_frame_{video_id}_{i:03d}.jpg')
-        if save_frame(video_path, scene_start.get_seconds(), output_path, duration):
-            with open(output_path, 'rb') as frame_data:
-                frames.append(VideoFrame(video_url=video_url, file=BytesIO(frame_data.read())))
-            saved_frames_count += 1
-            print(f"Сохранен кадр {i + 1}/{len(selected_scenes)}")
-        else:
-            print(f"Не удалось сохранить кадр {i + 1}/{len(selected_scenes)}")
-
-    # Возвращаем также путь к видеофайлу
+    saved_frames_count = 0  # Подсчет успешно извлеченных кадров
+
+    # Извлечение всех кадров из selected_scenes за один проход декодера
+    jpeg_frames = extract_keyframes_jpeg(video_path, [scene_start.get_seconds() for scene_start, _ in selected_scenes],
+                                         metadata)
+    if save_to_disk:
+        os.makedirs(output_folder, exist_ok=True)
+    for i, jpeg_data in enumerate(jpeg_frames):
+        if save_to_disk:
+            output_path = os.path.join(output_folder, f'key_frame_{video_id}_{i:03d}.jpg')
+            with open(output_path, 'wb') as frame_file:
+                frame_file.write(jpeg_data)
+        frames.append(VideoFrame(video_url=video_url, file=BytesIO(jpeg_data)))
+        saved_frames_count += 1
+    print(f"Извлечено кадров {saved_frames_count}/{len(selected_scenes)}")
+
+    # Кадры передаются дальше в памяти, возвращаем также путь к видеофайлу
     return frames, duration, saved_frames_count, video_path
 
-def save_frame(video_path: str, timecode: float, output_path: str, duration: float) -> bool:
-    # Уменьшаем время на 100 миллисекунд, чтобы избежать черного кадра на конце
-    safe_duration = duration - 0.1
-    if timecode < safe_duration:
-        subprocess.call([
-            'ffmpeg', '-y', '-i', video_path, '-ss', str(timecode),
-            '-vframes', '1', '-update', '1', output_path
-        ])
-        return True
-    return False
-
 def get_video_duration(video_path: str) -> float:
     result = subprocess.run(
         ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_path],
@@ -7,12 +7,15 @@ class FaissIndex:
         Инициализация индекса.
 
         :param d: Размерность векторов.
-        :param index_type: Тип индекса ('FlatL2' или 'IVFFlat').
+        :param index_type: Тип индекса ('FlatL2', 'IDMapFlatL2' или 'IVFFlat').
         """
         self.d = d
         self.index_type = index_type
         if index_type == 'FlatL2':
             self.index = faiss.IndexFlatL2(d)
+        elif index_type == 'IDMapFlatL2':
+            # Точный поиск с собственными идентификаторами строк и поддержкой удаления
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(d))
         elif index_type == 'IVFFlat':
             quantizer = faiss.IndexFlatL2(d)
             self.index = faiss.IndexIVFFlat(quantizer, d, 100)
@@ -28,6 +31,15 @@ class FaissIndex:
         """
         self.index.add(vectors)
 
+    def add_vectors_with_ids(self, vectors, ids):
+        """
+        Добавление векторов с заданными идентификаторами.
+
+        :param vectors: Вектора для добавления.
+        :param ids: Идентификаторы векторов (int64).
+        """
+        self.index.add_with_ids(vectors, np.asarray(ids, dtype='int64'))
+
     def remove_vectors(self, ids):
         """
         Удаление векторов по их идентификаторам.
@@ -37,7 +49,7 @@ class FaissIndex:
         if self.index_type == 'FlatL2':
             raise NotImplementedError("Этот индекс не поддерживает удаление векторов")
         elif hasattr(self.index, 'remove_ids'):
-            self.index.remove_ids(faiss.IDSelectorBatch(ids))
+            self.index.remove_ids(np.asarray(ids, dtype='int64'))
         else:
             raise NotImplementedError("Этот индекс не поддерживает удаление векторов")
 
@@ -70,13 +82,14 @@ class FaissIndex:
         """
         faiss.write_index(self.index, file_path)
 
-    def load_index(self, file_path):
+    def load_index(self, file_path, mmap=False):
         """
         Загрузка индекса из файла.
 
         :param file_path: Путь к файлу.
+        :param mmap: Отобразить файл в память вместо чтения целиком (только для чтения и поиска).
         """
-        self.index = faiss.read_index(file_path)
+        self.index = faiss.read_index(file_path, faiss.IO_FLAG_MMAP) if mmap else faiss.read_index(file_path)
 
     def get_total_vectors(self):
         """
@@ -0,0 +1,314 @@
+import argparse
+import json
+import os
+import time
+import logging
+import numpy as np
+from pymongo import DESCENDING
+
+from faiss_module import FaissIndex  # Ваш класс FaissIndex
+from mongo_connection import get_database, default_db_name
+from vector_codec import decode_document_vectors, count_document_vectors, vector_document_projection
+from create_FAISS_index import build_faiss_index_streaming
+
+# Настройка логирования
+logging.basicConfig(filename='processing.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(message)s')
+
+# Параметры базы данных
+db_name = default_db_name  # MONGO_DB
+collection_name = 'videos'
+tombstones_collection_name = 'video_tombstones'
+
+# Файл состояния синхронизации и каталог версий индекса
+sync_state_path = 'faiss_sync_state.json'
+versions_dir = 'faiss_versions'
+keep_versions = 3
+
+# Номера строк и удалений выделяются до фактической записи, поэтому запись, завершившаяся позже соседней,
+# может оказаться ниже отметки. Выделенные, но еще не прочитанные диапазоны строк хранятся в состоянии
+# (pending_ranges) и перечитываются, пока не будут записаны или пока не истечет pending_range_timeout
+# (диапазон, выделенный под дубликат или упавшую запись, никогда не заполнится).
+# inflight_rows - окно строк ниже отметки, которое считается незавершенным после полной перестройки.
+inflight_rows = int(os.environ.get('FAISS_SYNC_INFLIGHT_ROWS', '10000'))
+pending_range_timeout = 600
+overlap_tombstones = 1000
+
+# Размер пачки векторов при добавлении в индекс и пачки курсора MongoDB
+add_chunk_size = 10000
+cursor_batch_size = 1000
+
+
+def _get_collections():
+    db = get_database(db_name)
+    return db[collection_name], db[tombstones_collection_name]
+
+
+def load_sync_state(path=sync_state_path):
+    """
+    Загрузка состояния синхронизации.
+
+    :return: Словарь состояния или None, если синхронизация еще не выполнялась.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def _save_sync_state(state, path=sync_state_path):
+    # Атомарная замена: читатели видят либо старую, либо новую версию целиком
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _mapping_arrays(mapping):
+    # Словарь {номер строки: (video_id, тип)} -> массивы для файла связей
+    row_ids = np.fromiter(mapping.keys(), dtype='int64', count=len(mapping))
+    video_ids = np.array([video_id for video_id, _ in mapping.values()], dtype=str)
+    types = np.array([vector_type for _, vector_type in mapping.values()], dtype=str)
+    return row_ids, video_ids, types
+
+
+def _write_version(index, row_ids, video_ids, types, state):
+    os.makedirs(versions_dir, exist_ok=True)
+    version = state.get('version', 0) + 1
+    index_path = os.path.join(versions_dir, f'combined_vectors_v{version}.faiss')
+    mapping_path = os.path.join(versions_dir, f'index_mapping_v{version}.npz')
+
+    index.save_index(index_path)
+    with open(mapping_path, 'wb') as file:
+        np.savez(file, row_ids=row_ids, video_ids=video_ids, types=types)
+
+    new_state = dict(state, version=version, dim=index.d, index_path=index_path, mapping_path=mapping_path,
+                     total_vectors=index.get_total_vectors(), updated_at=time.time())
+    _save_sync_state(new_state)
+    _prune_versions(version)
+    return new_state
+
+
+def _prune_versions(current_version):
+    for filename in os.listdir(versions_dir):
+        stem = os.path.splitext(filename)[0]
+        version = stem.rsplit('_v', 1)[-1]
+        if version.isdigit() and int(version) <= current_version - keep_versions:
+            os.remove(os.path.join(versions_dir, filename))
+
+
+def _load_mapping(mapping_path):
+    with np.load(mapping_path) as data:
+        return {int(row_id): (str(video_id), str(vector_type))
+                for row_id, video_id, vector_type in zip(data['row_ids'], data['video_ids'], data['types'])}
+
+
+def _load_version(state):
+    index = FaissIndex(state['dim'], index_type='IDMapFlatL2')
+    index.load_index(state['index_path'])
+    return index, _load_mapping(state['mapping_path'])
+
+
+def load_synced_index(state=None, catch_up=False):
+    """
+    Загрузка последней версии индекса и связи его строк с видео.
+
+    :param state: Состояние синхронизации (читается из файла, если не передано).
+    :param catch_up: Применить в памяти изменения MongoDB после этой версии (без записи новой версии),
+                     так что с базы читается только разница.
+    :return: Кортеж (FaissIndex, {номер строки: video_id}, {номер строки: тип вектора}).
+    """
+    state = state or load_sync_state()
+    if state is None:
+        raise FileNotFoundError(f"Состояние синхронизации {sync_state_path} не найдено")
+    index, mapping = _load_version(state)
+    if catch_up:
+        _, added, removed = _apply_changes(index, mapping, state)
+        logging.info(f"Caught up Faiss index version {state['version']}: +{added} / -{removed} vectors.")
+    ids = {row_id: video_id for row_id, (video_id, _) in mapping.items()}
+    types = {row_id: vector_type for row_id, (_, vector_type) in mapping.items()}
+    return index, ids, types
+
+
+def _document_rows(document, video_index=None):
+    index_start = document.get('index_start')
+    if index_start is None:
+        # Документы, записанные до появления глобальных номеров строк, получают их при полной перестройке
+        from create_db import get_video_index
+        video_index = video_index or get_video_index()
+        index_start = video_index.allocate_indexes(count_document_vectors(document))
+        video_index.collection.update_one({'_id': document['_id']}, {'$set': {'index_start': index_start}})
+        document['index_start'] = index_start
+    return index_start, video_index
+
+
+def _add_documents(index, mapping, documents):
+    vectors, row_ids = [], []
+    for document, index_start in documents:
+        document_vectors, document_types = decode_document_vectors(document)
+        for offset, vector_type in enumerate(document_types):
+            mapping[index_start + offset] = (document['id'], vector_type)
+        vectors.append(document_vectors)
+        row_ids.extend(range(index_start, index_start + len(document_types)))
+    if row_ids:
+        index.add_vectors_with_ids(np.vstack(vectors), row_ids)
+    return len(row_ids)
+
+
+def rebuild_faiss_index():
+    """
+    Полная перестройка индекса из MongoDB (запасной вариант синхронизации).
+
+    Индекс строится потоком (create_FAISS_index.build_faiss_index_streaming) с ограниченной памятью.
+
+    :return: Новое состояние синхронизации.
+    """
+    collection, tombstones = _get_collections()
+    last_tombstone = tombstones.find_one({}, sort=[('seq', DESCENDING)])
+    tombstone_watermark = last_tombstone['seq'] if last_tombstone else 0
+
+    video_index = None
+
+    def document_rows(document):
+        nonlocal video_index
+        index_start, video_index = _document_rows(document, video_index)
+        return index_start
+
+    index, row_ids, video_ids, types = build_faiss_index_streaming(
+        document_rows, batch_size=cursor_batch_size, chunk_size=add_chunk_size)
+    index_watermark = int(row_ids.max()) + 1
+
+    state = load_sync_state() or {}
+    state.update(index_watermark=index_watermark, tombstone_watermark=tombstone_watermark,
+                 pending_ranges=[[max(0, index_watermark - inflight_rows), index_watermark, time.time()]])
+    state = _write_version(index, row_ids, video_ids, types, state)
+    logging.info(f"Rebuilt Faiss index version {state['version']} with {state['total_vectors']} vectors.")
+    return state
+
+
+def sync_faiss_index(full=False):
+    """
+    Инкрементальная синхронизация индекса с MongoDB.
+
+    Применяет только удаления (по записям video_tombstones) и новые документы, записанные
+    после отметки прошлой синхронизации, и сохраняет новую версию индекса. Если состояния
+    еще нет или передан full=True, выполняется полная перестройка.
+
+    :param full: Принудительная полная перестройка.
+    :return: Состояние синхронизации после выполнения.
+    """
+    state = load_sync_state()
+    if full or state is None:
+        return rebuild_faiss_index()
+
+    index, mapping = _load_version(state)
+    state, added, removed = _apply_changes(index, mapping, state)
+    if removed or added:
+        state = _write_version(index, *_mapping_arrays(mapping), state)
+        logging.info(f"Synced Faiss index version {state['version']}: +{added} / -{removed} vectors.")
+    else:
+        _save_sync_state(state)
+        logging.info("Faiss index is up to date.")
+    return state
+
+
+def _subtract_ranges(ranges, covered):
+    """
+    Части диапазонов [начало, конец, время выделения], не покрытые диапазонами covered [(начало, конец)].
+    """
+    covered = sorted(covered)
+    result = []
+    for start, end, since in ranges:
+        for covered_start, covered_end in covered:
+            if covered_end <= start:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > start:
+                result.append([start, covered_start, since])
+            start = max(start, covered_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append([start, end, since])
+    return result
+
+
+def _apply_changes(index, mapping, state):
+    """
+    Применение к индексу и связям строк удалений и новых документов после отметок состояния.
+
+    :return: Кортеж (новое состояние, добавлено строк, удалено строк).
+    """
+    collection, tombstones = _get_collections()
+    # Удаления и обновления (обновление = удаление + добавление с новыми строками)
+    removed_rows = set()
+    # Диапазоны строк, которые уже не нужно ждать: прочитанные документы и удаленные видео
+    covered = []
+    tombstone_watermark = state['tombstone_watermark']
+    rows_by_video = None
+    for tombstone in tombstones.find({'seq': {'$gt': tombstone_watermark - overlap_tombstones}}).sort('seq'):
+        tombstone_watermark = max(tombstone_watermark, tombstone['seq'])
+        if tombstone.get('index_start') is not None:
+            rows = range(tombstone['index_start'], tombstone['index_start'] + tombstone['rows'])
+            covered.append((rows.start, rows.stop))
+        elif tombstone['seq'] > state['tombstone_watermark']:
+            # Без номеров строк удаляем по идентификатору видео, но только один раз:
+            # повторное применение в окне задело бы строки видео, добавленного заново
+            if rows_by_video is None:
+                rows_by_video = {}
+                for row_id, (video_id, _) in mapping.items():
+                    rows_by_video.setdefault(video_id, []).append(row_id)
+            rows = rows_by_video.get(tombstone['video_id'], [])
+        else:
+            continue
+        removed_rows.update(row_id for row_id in rows if row_id in mapping)
+    if removed_rows:
+        index.remove_vectors(list(removed_rows))
+        for row_id in removed_rows:
+            del mapping[row_id]
+
+    # Новые документы: после отметки и в еще не заполненных диапазонах ниже нее
+    now = time.time()
+    index_watermark = state['index_watermark']
+    pending_ranges = state.get('pending_ranges')
+    if pending_ranges is None:
+        # Состояние, записанное до отслеживания диапазонов
+        pending_ranges = [[max(0, index_watermark - inflight_rows), index_watermark, now]]
+    expired = [pending_range for pending_range in pending_ranges if now - pending_range[2] >= pending_range_timeout]
+    if expired:
+        logging.warning(f"Row ranges were allocated but not written for {pending_range_timeout} seconds: {expired}")
+    pending_ranges = [pending_range for pending_range in pending_ranges if now - pending_range[2] < pending_range_timeout]
+    read_from = min([index_watermark] + [start for start, _, _ in pending_ranges])
+    added = 0
+    pending = []
+    query = {'index_start': {'$gte': read_from}}
+    for document in collection.find(query, vector_document_projection, batch_size=cursor_batch_size).sort('index_start'):
+        index_start = document['index_start']
+        rows = count_document_vectors(document)
+        covered.append((index_start, index_start + rows))
+        index_watermark = max(index_watermark, index_start + rows)
+        if rows == 0 or index_start in mapping:
+            continue  # Уже в индексе (лежит выше начала самого старого незаполненного диапазона)
+        pending.append((document, index_start))
+        if len(pending) >= add_chunk_size:
+            added += _add_documents(index, mapping, pending)
+            pending = []
+    added += _add_documents(index, mapping, pending)
+
+    # Строки между прошлой и новой отметкой, для которых документов еще нет, ждут следующей синхронизации
+    pending_ranges = _subtract_ranges(pending_ranges + [[state['index_watermark'], index_watermark, now]], covered)
+    state = dict(state, index_watermark=index_watermark, tombstone_watermark=tombstone_watermark,
+                 pending_ranges=pending_ranges)
+    return state, added, len(removed_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синхронизация индекса FAISS с MongoDB")
+    parser.add_argument('--full', action='store_true', help="Полная перестройка индекса")
+    parser.add_argument('--watch', type=float, default=None, help="Повторять синхронизацию каждые N секунд")
+    args = parser.parse_args()
+
+    sync_faiss_index(full=args.full)
+    while args.watch:
+        time.sleep(args.watch)
+        sync_faiss_index()
@@ -0,0 +1,57 @@
+import os
+import logging
+
+import cv2
+import numpy as np
+
+# Максимальное расстояние Хэмминга между dHash (из 64 бит), при котором кадры считаются дубликатами.
+# 0 - только одинаковые хэши, отрицательное значение отключает удаление дубликатов.
+dedup_hamming_threshold = int(os.environ.get('FRAME_DEDUP_THRESHOLD', '6'))
+hash_size = 8
+
+
+def dhash(image: np.ndarray) -> int:
+    """
+    Разностный перцептивный хэш кадра (dHash): сравнение соседних пикселей уменьшенного серого кадра.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def dhash_jpeg(jpeg_data: bytes) -> int:
+    # Декодирование сразу в уменьшенном размере 1/8
+    image = cv2.imdecode(np.frombuffer(jpeg_data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        raise ValueError("Не удалось декодировать кадр")
+    return dhash(image)
+
+
+def dedupe_frames(frames, threshold=dedup_hamming_threshold):
+    """
+    Удаление почти одинаковых ключевых кадров перед кодированием.
+
+    Кадр отбрасывается, если его dHash отличается от хэша любого уже оставленного кадра
+    не более чем на threshold бит, поэтому повторяющиеся планы (говорящая голова, слайды)
+    кодируются один раз.
+
+    :param frames: Список VideoFrame (JPEG в BytesIO).
+    :param threshold: Порог расстояния Хэмминга.
+    :return: Кортеж (оставленные кадры, количество отброшенных кадров).
+    """
+    if threshold < 0 or len(frames) < 2:
+        return frames, 0
+
+    kept, kept_hashes = [], []
+    for frame in frames:
+        frame_hash = dhash_jpeg(frame.file.getvalue())
+        if any(bin(frame_hash ^ kept_hash).count('1') <= threshold for kept_hash in kept_hashes):
+            continue
+        kept.append(frame)
+        kept_hashes.append(frame_hash)
+
+    dropped = len(frames) - len(kept)
+    logging.info(f"Frame dedupe: kept {len(kept)} of {len(frames)} frames, dropped {dropped}.")
+    return kept, dropped
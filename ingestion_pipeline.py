@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+
+from artifact_cache import stage_key
+
+
+@dataclass
+class Stage:
+    """
+    Этап обработки видео.
+
+    func получает словарь результатов этапов-зависимостей {имя: результат} и возвращает свой результат.
+
+    Кэширование: если задана version (версия модели и настроек этапа), результат сохраняется
+    в кэше артефактов по ключу из version, key_data и ключей зависимостей. Этап с content_key
+    возвращает ключ сам (например, хэш файла видео) и служит корнем цепочки ключей.
+    Этапы без version и content_key (например, скачивание) в ключи зависимых этапов не входят.
+    """
+    name: str
+    func: Callable
+    deps: tuple = ()
+    pool: str = 'io'
+    version: str | None = None
+    key_data: str = ''
+    content_key: bool = False
+
+
+@dataclass
+class StageGraphResult:
+    results: dict = field(default_factory=dict)
+    timings: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    cached: list = field(default_factory=list)
+    wall_time: float = 0.0
+
+
+def create_worker_pools(cpu_count=None):
+    """
+    Пулы потоков для этапов обработки, размеры зависят от числа ядер машины.
+
+    Модели (EasyOCR, Whisper, MarianMT) не рассчитаны на параллельные вызовы одного экземпляра,
+    поэтому каждой модели выделяется свой пул из одного потока: этапы разных моделей
+    выполняются одновременно, а вызовы одной модели - по очереди.
+
+    :param cpu_count: Число ядер (по умолчанию os.cpu_count()).
+    :return: Словарь {имя пула: ThreadPoolExecutor}.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return {
+        'io': ThreadPoolExecutor(max_workers=max(4, cpu_count), thread_name_prefix='stage-io'),
+        'cpu': ThreadPoolExecutor(max_workers=max(1, cpu_count // 2), thread_name_prefix='stage-cpu'),
+        'ocr': ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage-ocr'),
+        'asr': ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage-asr'),
+        'translation': ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage-translation'),
+    }
+
+
+def _run_timed(stage, dep_results, cache=None, key=None):
+    start_time = time.time()
+    if key is not None:
+        found, artifact = cache.get(key)
+        if found:
+            return artifact, None, time.time() - start_time, True
+    try:
+        result = stage.func(dep_results)
+    except Exception as e:
+        return None, e, time.time() - start_time, False
+    if key is not None and result is not None:
+        try:
+            cache.put(key, result)
+        except Exception as e:
+            logging.warning(f"Stage {stage.name} result was not cached: {str(e)}")
+    return result, None, time.time() - start_time, False
+
+
+def run_stage_graph(stages, pools, cache=None):
+    """
+    Выполнение графа этапов: каждый этап запускается, как только готовы его зависимости,
+    независимые этапы выполняются одновременно в своих пулах.
+
+    Ошибка этапа записывается в errors, а его результат считается None (как у функций обработки,
+    возвращающих None при сбое); зависимые этапы при этом выполняются. Ошибки и None не кэшируются.
+
+    :param stages: Список Stage.
+    :param pools: Словарь пулов из create_worker_pools.
+    :param cache: ArtifactCache для этапов с version (None - без кэша).
+    :return: StageGraphResult с результатами и временем выполнения каждого этапа.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Этап {stage.name} зависит от неизвестных этапов: {missing}")
+
+    graph_result = StageGraphResult()
+    start_time = time.time()
+    pending = {stage.name for stage in stages}
+    running = {}
+    keys = {}
+
+    while pending or running:
+        ready = [name for name in pending if all(dep in graph_result.results for dep in by_name[name].deps)]
+        for name in ready:
+            stage = by_name[name]
+            dep_results = {dep: graph_result.results[dep] for dep in stage.deps}
+            key = None
+            dep_keys = [keys.get(dep) for dep in stage.deps
+                        if by_name[dep].version is not None or by_name[dep].content_key]
+            if cache is not None and stage.version is not None and None not in dep_keys:
+                key = stage_key(name, stage.version, dep_keys, stage.key_data)
+            running[pools[stage.pool].submit(_run_timed, stage, dep_results, cache, key)] = name
+            keys[name] = key
+            pending.discard(name)
+        if not running:
+            raise ValueError(f"Циклическая зависимость между этапами: {sorted(pending)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            result, error, elapsed, cached = future.result()
+            graph_result.results[name] = result
+            graph_result.timings[name] = elapsed
+            if cached:
+                graph_result.cached.append(name)
+            # Ключ этапа передается зависимым этапам только при успешном выполнении
+            if by_name[name].content_key:
+                keys[name] = result
+            elif error is not None:
+                keys[name] = None
+            if error is not None:
+                graph_result.errors[name] = error
+                logging.error(f"Stage {name} failed: {str(error)}")
+
+    graph_result.wall_time = time.time() - start_time
+    return graph_result
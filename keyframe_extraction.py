@@ -0,0 +1,184 @@
+import json
+import subprocess
+import logging
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# Отступ от конца видео, чтобы избежать черного кадра на конце
+end_margin = 0.1
+
+
+@dataclass
+class VideoMetadata:
+    duration: float
+    fps: float
+    width: int
+    height: int
+    has_audio: bool
+
+
+def _parse_rate(rate):
+    num, _, den = rate.partition('/')
+    return float(num) / float(den) if den and float(den) else float(num)
+
+
+def probe_video(video_path: str) -> VideoMetadata:
+    """
+    Получение длительности, частоты кадров, размера и наличия звука одним вызовом ffprobe.
+    """
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries',
+         'format=duration:stream=codec_type,width,height,r_frame_rate,avg_frame_rate:stream_tags=rotate'
+         ':stream_side_data=rotation',
+         '-of', 'json', video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    info = json.loads(result.stdout)
+    streams = info.get('streams', [])
+    video_stream = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video_stream is None:
+        raise ValueError(f"В файле {video_path} нет видеопотока")
+
+    fps = _parse_rate(video_stream.get('avg_frame_rate', '0/0'))
+    if not fps:
+        fps = _parse_rate(video_stream.get('r_frame_rate', '0/0'))
+    # ffmpeg поворачивает кадры по метаданным, поэтому размер кадра в трубе учитывает поворот
+    rotation = video_stream.get('tags', {}).get('rotate')
+    for side_data in video_stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    width, height = int(video_stream['width']), int(video_stream['height'])
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    return VideoMetadata(
+        duration=float(info['format']['duration']),
+        fps=fps,
+        width=width,
+        height=height,
+        has_audio=any(stream.get('codec_type') == 'audio' for stream in streams),
+    )
+
+
+def extract_frames(video_path: str, timecodes, metadata: VideoMetadata = None) -> list[np.ndarray]:
+    """
+    Извлечение кадров в заданные моменты времени за один проход декодера.
+
+    Один процесс ffmpeg переходит по ключевому кадру к первому моменту (-ss перед -i),
+    отбирает нужные кадры фильтром select и отдает их в трубу как сырые BGR-кадры,
+    поэтому время извлечения линейно зависит от длины видео, а не от числа кадров.
+    Если ffmpeg вернул не все кадры, они извлекаются последовательным проходом OpenCV.
+
+    :param video_path: Путь к видео.
+    :param timecodes: Моменты времени в секундах.
+    :param metadata: Результат probe_video (если уже получен).
+    :return: Список кадров (массивы HxWx3, BGR) в порядке времени (моменты внутри одного кадра дают один кадр).
+    :raises ValueError: Если извлечены не все кадры.
+    """
+    metadata = metadata or probe_video(video_path)
+    safe_duration = metadata.duration - end_margin
+    fps = metadata.fps or 25.0
+    # Моменты приводятся к номерам кадров: сцены PySceneDetect начинаются ровно на кадре N (t = N / fps)
+    frame_numbers = sorted({int(round(timecode * fps)) for timecode in timecodes if timecode < safe_duration})
+    if not frame_numbers:
+        return []
+
+    # Окно длиной в один кадр с центром в моменте кадра (без округления времени), в него попадает ровно кадр N
+    select = '+'.join(f'between(t\\,{(number - 0.5) / fps:.6f}\\,{(number + 0.5) / fps:.6f})'
+                      for number in frame_numbers)
+    seek = max(0.0, frame_numbers[0] / fps - 1.0)
+    command = [
+        'ffmpeg', '-v', 'error', '-ss', f'{seek:.3f}', '-i', video_path, '-copyts',
+        '-vf', f"select='{select}'", '-vsync', '0',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'
+    ]
+
+    frame_size = metadata.width * metadata.height * 3
+    frames = []
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while len(frames) < len(frame_numbers):
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            frames.append(np.frombuffer(data, dtype=np.uint8).reshape(metadata.height, metadata.width, 3))
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+    if len(frames) < len(frame_numbers):
+        # Переменная частота кадров или неточные метки времени: кадры берутся последовательным проходом
+        logging.warning(f"Extracted {len(frames)} of {len(frame_numbers)} frames from {video_path} with ffmpeg, "
+                        f"falling back to sequential decoding")
+        frames = _extract_frames_sequential(video_path, [(number - 0.5) / fps for number in frame_numbers])
+    if len(frames) < len(frame_numbers):
+        raise ValueError(f"Извлечено {len(frames)} из {len(frame_numbers)} кадров из {video_path}")
+    return frames
+
+
+def _extract_frames_sequential(video_path, timecodes):
+    cap = cv2.VideoCapture(video_path)
+    keyframes = []
+    try:
+        # Выборка по интервалу не нужна: проход только собирает кадры в моменты timecodes
+        for _ in sample_frames_sequential(cap, float('inf'), timecodes, keyframes):
+            pass
+    finally:
+        cap.release()
+    return keyframes
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = 90) -> bytes:
+    """
+    Кодирование кадра в JPEG в памяти.
+    """
+    success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Не удалось закодировать кадр в JPEG")
+    return buffer.tobytes()
+
+
+def extract_keyframes_jpeg(video_path: str, timecodes, metadata: VideoMetadata = None, quality: int = 90) -> list[bytes]:
+    """
+    Извлечение кадров за один проход с кодированием в JPEG (байты в памяти).
+    """
+    return [encode_jpeg(frame, quality) for frame in extract_frames(video_path, timecodes, metadata)]
+
+
+def sample_frames_sequential(cap, interval, keyframe_times=(), keyframes=None):
+    """
+    Последовательное чтение видео за один проход без перемотки.
+
+    Каждый кадр только извлекается из потока (grab), декодируется (retrieve) лишь кадр в точке выборки,
+    поэтому стоимость - один линейный проход независимо от числа выборок. Тот же проход может
+    собрать ключевые кадры: кадры в моменты keyframe_times добавляются в список keyframes.
+
+    :param cap: Открытый cv2.VideoCapture.
+    :param interval: Интервал выборки, секунды.
+    :param keyframe_times: Моменты ключевых кадров, секунды.
+    :param keyframes: Список для ключевых кадров (BGR-массивы в порядке времени).
+    :return: Генератор кадров (BGR-массивы), взятых каждые interval секунд.
+    """
+    keyframe_times = sorted(keyframe_times)
+    next_sample = 0.0
+    next_keyframe = 0
+    while True:
+        if not cap.grab():
+            break
+        position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        take_sample = position >= next_sample
+        take_keyframe = keyframes is not None and next_keyframe < len(keyframe_times) and \
+            position >= keyframe_times[next_keyframe]
+        if not take_sample and not take_keyframe:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        while take_keyframe and next_keyframe < len(keyframe_times) and position >= keyframe_times[next_keyframe]:
+            keyframes.append(frame)
+            next_keyframe += 1
+        if take_sample:
+            while next_sample <= position:
+                next_sample += interval
+            yield frame
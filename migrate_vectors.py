@@ -0,0 +1,105 @@
+import argparse
+import logging
+import pickle
+from pymongo import UpdateOne
+
+from mongo_connection import get_collection, default_db_name
+from vector_codec import VECTOR_FORMAT_VERSION, encode_video_document
+
+# Настройка логирования
+logging.basicConfig(filename='processing.log', level=logging.INFO, format='%(asctime)s - %(name)s - %(message)s')
+
+# Параметры базы данных
+db_name = default_db_name  # MONGO_DB
+collection_name = 'videos'
+
+vector_fields = ['video_vectors', 'description_vector', 'subtitle_vector', 'audio_vector']
+
+
+def _load_legacy(value):
+    return pickle.loads(value) if value is not None else None
+
+
+def _stored_size(document):
+    size = 0
+    for field in vector_fields:
+        value = document.get(field)
+        if isinstance(value, list):
+            size += sum(len(vec) for vec in value)
+        elif value is not None:
+            size += len(value)
+    return size
+
+
+def convert_legacy_document(document, dtype='float32'):
+    """
+    Перевод документа из формата pickle-списков в компактный формат.
+
+    :param document: Документ старого формата.
+    :param dtype: Тип хранения векторов.
+    :return: Словарь полей для $set.
+    """
+    video_vectors = [pickle.loads(vec) for vec in document.get('video_vectors') or []]
+    new_document = encode_video_document(
+        document['id'],
+        video_vectors,
+        _load_legacy(document.get('description_vector')),
+        _load_legacy(document.get('subtitle_vector')),
+        _load_legacy(document.get('audio_vector')),
+        dtype=dtype,
+    )
+    del new_document['id']
+    return new_document
+
+
+def migrate_vectors(dtype='float32', batch_size=500, dry_run=False):
+    """
+    Потоковая миграция документов со старым форматом векторов.
+
+    Документы читаются курсором и записываются пачками bulk_write, поэтому память
+    не зависит от размера коллекции. Повторный запуск продолжает с необработанных документов.
+
+    :param dtype: Тип хранения векторов ('float32' или 'float16').
+    :param batch_size: Размер пачки чтения и записи.
+    :param dry_run: Только подсчитать экономию, ничего не записывая.
+    :return: Словарь со статистикой миграции.
+    """
+    collection = get_collection(collection_name, db_name)
+
+    stats = {'documents': 0, 'bytes_before': 0, 'bytes_after': 0}
+    operations = []
+    cursor = collection.find({'vector_format': {'$ne': VECTOR_FORMAT_VERSION}}, batch_size=batch_size)
+    try:
+        for document in cursor:
+            new_fields = convert_legacy_document(document, dtype=dtype)
+            stats['documents'] += 1
+            stats['bytes_before'] += _stored_size(document)
+            stats['bytes_after'] += sum(len(new_fields[field]) for field in vector_fields if new_fields[field] is not None)
+            operations.append(UpdateOne({'_id': document['_id']}, {'$set': new_fields}))
+
+            if len(operations) >= batch_size:
+                if not dry_run:
+                    collection.bulk_write(operations, ordered=False)
+                operations = []
+                logging.info(f"Migrated {stats['documents']} documents.")
+
+        if operations and not dry_run:
+            collection.bulk_write(operations, ordered=False)
+    finally:
+        cursor.close()
+
+    log_message = (f"Vector migration finished: {stats['documents']} documents, "
+                   f"{stats['bytes_before']} -> {stats['bytes_after']} bytes of vector data"
+                   f"{' (dry run)' if dry_run else ''}.")
+    print(log_message)
+    logging.info(log_message)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграция векторов MongoDB в компактный формат")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    migrate_vectors(dtype=args.dtype, batch_size=args.batch_size, dry_run=args.dry_run)
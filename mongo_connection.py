@@ -0,0 +1,90 @@
+import os
+import threading
+import logging
+from pymongo import MongoClient
+
+# Параметры подключения (переопределяются переменными окружения)
+mongo_uri = os.environ.get('MONGO_URI', "mongodb://mongo:27017/")
+default_db_name = os.environ.get('MONGO_DB', 'video_database')
+max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+server_selection_timeout_ms = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+connect_timeout_ms = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+socket_timeout_ms = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 60000))
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def _client_options():
+    return {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'serverSelectionTimeoutMS': server_selection_timeout_ms,
+        'connectTimeoutMS': connect_timeout_ms,
+        'socketTimeoutMS': socket_timeout_ms,
+        'retryReads': True,
+        'retryWrites': True,
+    }
+
+
+def get_client():
+    """
+    Общий для процесса MongoClient с пулом соединений.
+
+    Клиент создается при первом обращении, соединение устанавливается при первой операции.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(mongo_uri, connect=False, **_client_options())
+                logging.info(f"Created shared MongoDB client for {mongo_uri} (pool size {max_pool_size}).")
+    return _client
+
+
+def get_database(db_name=None):
+    """
+    База данных на общем клиенте.
+
+    :param db_name: Название базы данных (по умолчанию MONGO_DB).
+    """
+    return get_client()[db_name or default_db_name]
+
+
+def get_collection(collection_name, db_name=None):
+    """
+    Коллекция на общем клиенте.
+
+    :param collection_name: Название коллекции.
+    :param db_name: Название базы данных (по умолчанию MONGO_DB).
+    """
+    return get_database(db_name)[collection_name]
+
+
+def get_async_client():
+    """
+    Общий для процесса асинхронный клиент (motor) с теми же настройками пула.
+    """
+    global _async_client
+    if _async_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncIOMotorClient(mongo_uri, **_client_options())
+    return _async_client
+
+
+def close_clients():
+    """
+    Закрытие общих клиентов (при завершении процесса).
+    """
+    global _client, _async_client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
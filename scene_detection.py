@@ -0,0 +1,70 @@
+import os
+import logging
+
+from scenedetect import detect, open_video, SceneManager, ContentDetector
+
+# Параметры быстрого режима. Быстрый режим меняет выбранные ключевые кадры, поэтому включается явно
+# (SCENE_DETECTION_FAST=1) после проверки совпадения сцен скриптом benchmark_scene_detection.py
+fast_mode_default = os.environ.get('SCENE_DETECTION_FAST', '0') == '1'
+analysis_width = 256  # Ширина кадра для анализа, пикселей
+analysis_fps = 8  # Примерное число анализируемых кадров в секунду
+min_scene_len_frames = 15  # Минимальная длина сцены в кадрах исходного видео (как у ContentDetector)
+# Множитель порога в быстром режиме: разница между кадрами, взятыми через frame_skip, больше разницы
+# соседних кадров (движение накапливается), поэтому с тем же порогом быстрый режим находит больше сцен.
+# Значение подбирается по benchmark_scene_detection.py --fast-threshold-factor
+fast_threshold_factor = float(os.environ.get('SCENE_FAST_THRESHOLD_FACTOR', '1.0'))
+
+
+def fast_detection_params(fps, frame_width):
+    """
+    Коэффициенты уменьшения и пропуска кадров для быстрого режима.
+
+    :return: Кортеж (downscale, frame_skip).
+    """
+    downscale = max(1, round(frame_width / analysis_width))
+    frame_skip = max(0, round(fps / analysis_fps) - 1)
+    return downscale, frame_skip
+
+
+def detect_scenes(video_path, threshold=7.5, fast=fast_mode_default, downscale=None, frame_skip=None, video=None,
+                  threshold_factor=None):
+    """
+    Определение границ сцен.
+
+    В обычном режиме анализируется каждый кадр (scenedetect.detect). В быстром режиме кадры
+    уменьшаются до ~analysis_width пикселей по ширине и анализируется ~analysis_fps кадров в секунду.
+    Результат в обоих режимах - список пар (начало, конец) FrameTimecode, совместимый
+    со split_scenes/choose_scenes.
+
+    :param video_path: Путь к видео.
+    :param threshold: Порог ContentDetector.
+    :param fast: Быстрый режим.
+    :param downscale: Коэффициент уменьшения кадра (по умолчанию по ширине видео).
+    :param frame_skip: Число пропускаемых кадров между анализируемыми (по умолчанию по fps).
+    :param video: Уже открытый VideoStream scenedetect (общий декодер), перематывается в начало.
+    :param threshold_factor: Множитель порога в быстром режиме (по умолчанию fast_threshold_factor).
+    :return: Список сцен.
+    """
+    if not fast:
+        return detect(video_path, ContentDetector(threshold=threshold))
+
+    if video is None:
+        video = open_video(video_path)
+    else:
+        video.reset()
+
+    auto_downscale, auto_frame_skip = fast_detection_params(video.frame_rate, video.frame_size[0])
+    downscale = downscale or auto_downscale
+    frame_skip = auto_frame_skip if frame_skip is None else frame_skip
+
+    scene_manager = SceneManager()
+    scene_manager.auto_downscale = False
+    scene_manager.downscale = downscale
+    # scenedetect считает min_scene_len в кадрах исходного видео и при frame_skip
+    threshold = threshold * (fast_threshold_factor if threshold_factor is None else threshold_factor)
+    scene_manager.add_detector(ContentDetector(threshold=threshold, min_scene_len=min_scene_len_frames))
+    scene_manager.detect_scenes(video=video, frame_skip=frame_skip)
+    scenes = scene_manager.get_scene_list()
+    logging.info(f"Fast scene detection for {video_path}: {len(scenes)} scenes "
+                 f"(downscale {downscale}, frame_skip {frame_skip}, threshold {threshold:.2f}).")
+    return scenes
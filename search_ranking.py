@@ -0,0 +1,71 @@
+from collections import defaultdict
+
+# Весовые коэффициенты
+v_weight = 0.6  # Вес для видео
+d_weight = 0.1  # Вес для описания
+s_weight = 0.1  # Вес для субтитров
+a_weight = 0.2  # Вес для аудио
+
+type_weights = {
+    'video': v_weight,
+    'description': d_weight,
+    'subtitle': s_weight,
+    'audio': a_weight,
+}
+
+
+def get_type_weight(vector_type):
+    return type_weights.get(vector_type, 1)  # Default weight if type is unknown
+
+
+def compute_total_weights(ids, types):
+    """
+    Суммарный вес всех векторов каждого видео.
+
+    Считается один раз при загрузке индекса, а не на каждый запрос.
+
+    :param ids: Идентификаторы видео по строкам индекса (список или словарь {номер строки: video_id}).
+    :param types: Типы векторов по строкам индекса (список или словарь {номер строки: тип}).
+    :return: Словарь {video_id: суммарный вес}.
+    """
+    if isinstance(ids, dict):
+        ids, types = ids.values(), [types[row_id] for row_id in ids]
+    total_weights = defaultdict(float)
+    for video_id, vector_type in zip(ids, types):
+        if vector_type in type_weights:
+            total_weights[video_id] += type_weights[vector_type]
+    return dict(total_weights)
+
+
+def rank_videos(distances, indices, ids, types, total_weights):
+    """
+    Агрегация расстояний найденных векторов по видео с учетом весов.
+
+    :param distances: Строка расстояний из результата поиска FAISS.
+    :param indices: Строка индексов из результата поиска FAISS.
+    :param ids: Отображение индекса строки в идентификатор видео (список или словарь).
+    :param types: Отображение индекса строки в тип вектора (список или словарь).
+    :param total_weights: Результат compute_total_weights.
+    :return: Список пар (video_id, расстояние), отсортированный по возрастанию расстояния.
+    """
+    # Создание карты расстояний и корректировка весов
+    id_distance_map = {}
+    for idx, distance in zip(indices, distances):
+        if idx < 0:
+            continue  # FAISS возвращает -1, если соседей меньше k
+        video_id = ids[idx]
+        weight = get_type_weight(types[idx])
+
+        if video_id in id_distance_map:
+            id_distance_map[video_id] += distance * weight
+        else:
+            id_distance_map[video_id] = distance * weight
+
+    # Корректировка весов для видео
+    for video_id in id_distance_map.keys():
+        total_weight = total_weights.get(video_id, 0)
+        if total_weight and total_weight != 1:
+            id_distance_map[video_id] /= total_weight
+
+    # Сортировка по суммарному расстоянию
+    return sorted(id_distance_map.items(), key=lambda item: item[1])
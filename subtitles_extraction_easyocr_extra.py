@@ -1,10 +1,14 @@
 import json
+import os
 import logging
 import cv2
 import time
 import re
+import itertools
 import easyocr
 
+from keyframe_extraction import sample_frames_sequential
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -16,6 +20,23 @@ exceptions = {"3Д", "3д", "2Д", "2д", "2D", "3D", "4G", "5G", "H2O", "CO2",
 # Инициализация EasyOCR
 reader = easyocr.Reader(['ru', 'en'])
 
+# Параметры OCR: 'batched' - пакетное распознавание полосы субтитров, 'full' - весь кадр по одному
+ocr_mode_default = os.environ.get('OCR_MODE', 'batched')
+# Полоса субтитров: доли высоты кадра (верх, низ)
+subtitle_region = (0.65, 1.0)
+# Ширина, до которой уменьшается полоса субтитров перед распознаванием
+ocr_width = 960
+ocr_batch_size = 16
+# Количество первых кадров для автоматического определения полосы субтитров
+auto_region_frames = 8
+# Порог изменения полосы субтитров (средняя разница яркости уменьшенной полосы, 0-255);
+# полоса, не изменившаяся с предыдущего кадра, повторно не распознается. Отрицательный порог отключает проверку
+ocr_change_threshold = float(os.environ.get('OCR_CHANGE_THRESHOLD', '3.0'))
+# Интервал выборки кадров для OCR, секунды
+ocr_sample_interval = float(os.environ.get('OCR_SAMPLE_INTERVAL', '2'))
+# Строка настроек для версии этапа в кэше артефактов
+subtitles_config = f'interval={ocr_sample_interval}:{ocr_mode_default}:region={subtitle_region}:width={ocr_width}:change={ocr_change_threshold}'
+
 # Функция для предобработки кадра
 def preprocess_frame(frame):
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
@@ -23,7 +44,7 @@ def preprocess_frame(frame):
     return gray
 
 # Функция для извлечения субтитров
-def extract_subtitles_from_frame(frame):
+def extract_subtitles_from_frame(frame, raise_errors=False):
     try:
         # Предобработка кадра
         processed_frame = preprocess_frame(frame)
@@ -33,6 +54,8 @@ def extract_subtitles_from_frame(frame):
         return text
     except Exception as e:
         logging.error(f"Ошибка извлечения субтитров: {str(e)}")
+        if raise_errors:
+            raise
         return ""
 
 # Функция для очистки текста субтитров
@@ -76,7 +99,111 @@ def clean_subtitles_text(text):
         logging.error(f"Ошибка очистки текста субтитров: {str(e)}")
         return ""
 
-def get_subtitles(video_path):
+# Функция для вырезания и уменьшения полосы субтитров
+def crop_subtitle_region(frame, region=subtitle_region, width=ocr_width):
+    height = frame.shape[0]
+    top, bottom = int(height * region[0]), int(height * region[1])
+    crop = preprocess_frame(frame[top:bottom])
+    if crop.shape[1] > width:
+        scale = width / crop.shape[1]
+        crop = cv2.resize(crop, (width, max(1, int(crop.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    return crop
+
+# Функция для автоматического определения полосы субтитров по нескольким кадрам
+def detect_subtitle_region(frames, default=subtitle_region, margin=0.02):
+    y_min, y_max = None, None
+    for frame in frames:
+        height = frame.shape[0]
+        horizontal_list, _ = reader.detect(preprocess_frame(frame))
+        for x_left, x_right, y_top, y_bottom in horizontal_list[0]:
+            # Субтитры ищем только в нижней половине кадра
+            if y_top / height < 0.5:
+                continue
+            y_min = y_top / height if y_min is None else min(y_min, y_top / height)
+            y_max = y_bottom / height if y_max is None else max(y_max, y_bottom / height)
+    if y_min is None:
+        return default
+    return max(0.0, y_min - margin), min(1.0, y_max + margin)
+
+# Функция для проверки, изменилась ли полоса субтитров
+def region_signature(crop):
+    return cv2.resize(crop, (64, 16), interpolation=cv2.INTER_AREA).astype('int16')
+
+def region_changed(signature, previous_signature, threshold=ocr_change_threshold):
+    if previous_signature is None or threshold < 0:
+        return True
+    return float(abs(signature - previous_signature).mean()) > threshold
+
+# Функция для пакетного распознавания полосы субтитров
+def extract_subtitles_batched(frames, region=subtitle_region, batch_size=ocr_batch_size,
+                              change_threshold=ocr_change_threshold, raise_errors=False):
+    """
+    Пакетное распознавание полос субтитров; распознаются только полосы, изменившиеся с предыдущего кадра.
+
+    :param raise_errors: Передавать ошибку EasyOCR вызывающему коду вместо пустого текста полос.
+
+    :return: Кортеж (тексты распознанных полос, количество кадров).
+    """
+    texts = []
+    batch = []
+    frame_count = 0
+    previous_signature = None
+    for frame in frames:
+        frame_count += 1
+        crop = crop_subtitle_region(frame, region)
+        signature = region_signature(crop)
+        changed = region_changed(signature, previous_signature, change_threshold)
+        previous_signature = signature
+        if not changed:
+            continue
+        batch.append(crop)
+        if len(batch) >= batch_size:
+            texts.extend(_readtext_batch(batch, batch_size, raise_errors))
+            batch = []
+    if batch:
+        texts.extend(_readtext_batch(batch, batch_size, raise_errors))
+    return texts, frame_count
+
+# Функция для объединения одинаковых строк субтитров, идущих подряд
+def merge_repeated_lines(lines):
+    merged = []
+    for line in lines:
+        if not merged or merged[-1] != line:
+            merged.append(line)
+    return merged
+
+def _readtext_batch(crops, batch_size, raise_errors=False):
+    try:
+        # Полосы одного видео одного размера, поэтому пакет распознается без изменения размера
+        results = reader.readtext_batched(crops, n_width=crops[0].shape[1], n_height=crops[0].shape[0],
+                                          batch_size=batch_size, detail=0)
+        return [' '.join(result) for result in results]
+    except Exception as e:
+        logging.error(f"Ошибка извлечения субтитров: {str(e)}")
+        if raise_errors:
+            raise
+        return [""] * len(crops)
+
+def get_subtitles(video_path, mode=ocr_mode_default, region=subtitle_region, auto_region=False,
+                  interval=ocr_sample_interval, keyframe_times=(), keyframes=None, raise_errors=False):
+    """
+    Извлечение субтитров из кадров, взятых каждые interval секунд.
+
+    Видео читается последовательно за один проход (sample_frames_sequential); если переданы
+    keyframe_times и список keyframes, в том же проходе собираются ключевые кадры.
+
+    В режиме 'batched' распознается только уменьшенная полоса субтитров (region - доли высоты кадра
+    или auto_region=True для определения по первым кадрам), кадры распознаются пакетами.
+    В режиме 'full' каждый кадр распознается целиком по одному.
+
+    :param raise_errors: Передавать исключение (в том числе ошибку EasyOCR на отдельном кадре) вызывающему коду
+                         вместо возврата (None, None) и пустого текста кадра
+                         (в графе этапов, чтобы сбой не попал в кэш артефактов).
+    :return: Кортеж (текст субтитров или None, время обработки).
+    """
+    if mode == 'batched':
+        return _get_subtitles_batched(video_path, region, auto_region, interval, keyframe_times, keyframes,
+                                      raise_errors)
     try:
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
@@ -84,22 +211,16 @@ def get_subtitles(video_path):
 
         start_time = time.time()
         frame_count = 0  # Счетчик обработанных кадров
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        video_duration = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) / fps
 
         subtitles_text = []
-        for sec in range(0, int(video_duration), 2):
-            cap.set(cv2.CAP_PROP_POS_MSEC, sec * 1000)
-            ret, frame = cap.read()
-            if not ret:
-                break
-            subtitle = extract_subtitles_from_frame(frame)
+        for frame in sample_frames_sequential(cap, interval, keyframe_times, keyframes):
+            subtitle = extract_subtitles_from_frame(frame, raise_errors)
             subtitle = clean_subtitles_text(subtitle)
             if subtitle.strip():
                 subtitles_text.append(subtitle.strip())
                 frame_count += 1  # Увеличиваем счетчик только если субтитры найдены
 
-        subtitles = " ".join(subtitles_text).replace('\n', ' ')
+        subtitles = " ".join(merge_repeated_lines(subtitles_text)).replace('\n', ' ')
         processing_time = time.time() - start_time
 
         cap.release()
@@ -107,6 +228,45 @@ def get_subtitles(video_path):
         return subtitles if subtitles else None, processing_time  # Возвращаем None, если субтитров нет
     except Exception as e:
         logging.error(f'Ошибка обработки видео: {str(e)}')
+        if raise_errors:
+            raise
+        return None, None
+
+def _get_subtitles_batched(video_path, region, auto_region, interval, keyframe_times, keyframes, raise_errors=False):
+    try:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception("Не удается открыть видео")
+
+        start_time = time.time()
+        frames = sample_frames_sequential(cap, interval, keyframe_times, keyframes)
+
+        if auto_region:
+            # Полоса определяется по нескольким первым кадрам, остальные кадры читаются потоком
+            first_frames = list(itertools.islice(frames, auto_region_frames))
+            region = detect_subtitle_region(first_frames[1::2], default=region)
+            frames = itertools.chain(first_frames, frames)
+
+        # Кадры не накапливаются: в памяти только пакет уменьшенных полос
+        subtitles_text = []
+        texts, frame_count = extract_subtitles_batched(frames, region, raise_errors=raise_errors)
+        for subtitle in texts:
+            subtitle = clean_subtitles_text(subtitle)
+            if subtitle.strip():
+                subtitles_text.append(subtitle.strip())
+        cap.release()
+
+        subtitles = " ".join(merge_repeated_lines(subtitles_text)).replace('\n', ' ')
+        processing_time = time.time() - start_time
+        frames_per_second = frame_count / processing_time if processing_time else 0.0
+        logging.info(f"OCR: {frame_count} frames in {processing_time:.2f} s ({frames_per_second:.1f} frames/sec), "
+                     f"{len(texts)} OCR calls ({frame_count - len(texts)} unchanged regions skipped), region {region}")
+
+        return subtitles if subtitles else None, processing_time  # Возвращаем None, если субтитров нет
+    except Exception as e:
+        logging.error(f'Ошибка обработки видео: {str(e)}')
+        if raise_errors:
+            raise
         return None, None
 
 # Пример вызова функции
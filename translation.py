@@ -1,9 +1,14 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+import os
 import re
+import threading
+
+from translation_cache import PhraseTranslationCache
+from translation_runtime import runtime_version, output_length_ratio, load_translator
 
 model_name = 'Helsinki-NLP/opus-mt-ru-en'
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# Модель перевода загружается при первом переводе, а не при импорте модуля
+_translator = None
+_translator_lock = threading.Lock()
 
 # Словарь исключений
 exceptions = {
@@ -25,15 +30,60 @@ exceptions = {
 # Фраза для исключения
 exclude_phrase = "The present document is being issued without formal editing."
 
+# Размер пакета фраз для одного вызова generate
+translation_batch_size = int(os.environ.get('TRANSLATION_BATCH_SIZE', '32'))
+# Версия перевода для кэша артефактов этапов (среда выполнения влияет на результат: int8 и жадное декодирование)
+translation_version = f'{model_name}:{runtime_version()}:batched-v1:ratio={output_length_ratio}'
+
+# Кэш переводов фраз, общий для процессов обработки и поиска; исключения закреплены в кэше
+phrase_cache = PhraseTranslationCache(translation_version, pinned=exceptions)
+
+def get_translator():
+    """
+    Модель перевода в среде TRANSLATION_RUNTIME, загружается один раз при первом обращении.
+    """
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                _translator = load_translator(model_name)
+    return _translator
+
+# Эталонный перевод одной фразы (исходная реализация, используется для сравнения качества)
 def translate(text, model, tokenizer):
     input_ids = tokenizer.encode(text, return_tensors="pt")
     output_ids = model.generate(input_ids, max_new_tokens=100)
     en_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
     return en_text
 
+def translate_batch(phrases, translator=None, batch_size=translation_batch_size):
+    """
+    Пакетный перевод фраз.
+
+    Повторяющиеся фразы переводятся один раз, фразы сортируются по длине, чтобы пакеты
+    дополнялись минимально, на пакет - один вызов модели с ограничением длины по входу.
+
+    :param phrases: Список фраз.
+    :param translator: Модель перевода (по умолчанию get_translator()).
+    :return: Список переводов в исходном порядке.
+    """
+    if not phrases:
+        return []
+    translator = translator or get_translator()
+    unique_phrases = sorted(dict.fromkeys(phrases), key=len, reverse=True)
+    translations = {}
+    for start in range(0, len(unique_phrases), batch_size):
+        batch = unique_phrases[start:start + batch_size]
+        translations.update(zip(batch, translator.translate_batch(batch)))
+    return [translations[phrase] for phrase in phrases]
+
 def contains_cyrillic(text):
     return bool(re.search('[\u0400-\u04FF]', text))
 
+# Текст без кириллицы считается английским и не отправляется в MarianMT
+def needs_translation(text):
+    return bool(text) and contains_cyrillic(text)
+
 def translate_text(text):
     # Заменяем фразы из словаря исключений на их переводы
     for phrase, translation in exceptions.items():
@@ -43,10 +93,18 @@ def translate_text(text):
     translated_words = []
     seen_words = set()
 
+    # Фразы с кириллицей ищутся в кэше, остальные переводятся пакетно за один-два вызова модели
+    cyrillic_words = [word.strip() for word in words if contains_cyrillic(word.strip())]
+    batch_translations = phrase_cache.get_many(cyrillic_words)
+    missing_words = [word for word in dict.fromkeys(cyrillic_words) if word not in batch_translations]
+    new_translations = dict(zip(missing_words, translate_batch(missing_words)))
+    phrase_cache.put_many(new_translations)
+    batch_translations.update(new_translations)
+
     for word in words:
         clean_word = word.strip()
         if contains_cyrillic(clean_word):
-            translated_word = translate(clean_word, model, tokenizer)
+            translated_word = batch_translations[clean_word]
             if translated_word != exclude_phrase and translated_word not in seen_words:
                 translated_words.append(translated_word)
                 seen_words.add(translated_word)
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+# Файл общего кэша переводов (пустое значение отключает дисковый уровень) и размер LRU в памяти процесса
+translation_cache_path = os.environ.get('TRANSLATION_CACHE_PATH', 'translation_cache.sqlite')
+translation_cache_size = int(os.environ.get('TRANSLATION_CACHE_SIZE', '100000'))
+# Максимальное число строк в файле кэша (0 - без ограничения), старые строки удаляются по created_at
+translation_cache_max_rows = int(os.environ.get('TRANSLATION_CACHE_MAX_ROWS', '1000000'))
+# Период проверки размера файла (число записанных строк)
+prune_interval = 10000
+# Период записи статистики в журнал (число запросов)
+stats_log_interval = 1000
+
+
+def normalize_phrase(phrase):
+    return ' '.join(phrase.lower().replace('ё', 'е').split())
+
+
+class PhraseTranslationCache:
+    def __init__(self, model_key, db_path=translation_cache_path, max_size=translation_cache_size, pinned=None,
+                 max_rows=translation_cache_max_rows):
+        """
+        Кэш переводов фраз: LRU в памяти процесса и общий для всех процессов файл SQLite.
+
+        :param model_key: Идентификатор модели перевода (часть ключа).
+        :param db_path: Путь к файлу SQLite (None или '' - только память).
+        :param max_size: Размер LRU.
+        :param pinned: Закрепленные переводы {фраза: перевод} (словарь исключений), не вытесняются.
+        :param max_rows: Максимальное число строк в файле SQLite (0 - без ограничения).
+        """
+        self.model_key = model_key
+        self.db_path = db_path or None
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.rows_since_prune = 0
+        self.pinned = {normalize_phrase(phrase): translation for phrase, translation in (pinned or {}).items()}
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {'lookups': 0, 'pinned_hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        if self.db_path:
+            connection = self._connection()
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS translations (
+                    model TEXT NOT NULL,
+                    phrase TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (model, phrase)
+                )''')
+            connection.execute('CREATE INDEX IF NOT EXISTS translations_created_at ON translations (created_at)')
+            connection.commit()
+
+    def _connection(self):
+        # Соединение SQLite на каждый поток
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            self.local.connection = connection
+        return connection
+
+    def _remember(self, phrase, translation):
+        self.memory[phrase] = translation
+        self.memory.move_to_end(phrase)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def _select(self, keys):
+        rows = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows.extend(self._connection().execute(
+                f'SELECT phrase, translation FROM translations WHERE model = ? AND phrase IN '
+                f'({",".join("?" * len(chunk))})', (self.model_key, *chunk)).fetchall())
+        return rows
+
+    def get_many(self, phrases):
+        """
+        Поиск переводов фраз.
+
+        :return: Словарь {фраза: перевод} для найденных фраз.
+        """
+        phrases = list(phrases)
+        found = {}
+        missing = {}
+        with self.lock:
+            for phrase in phrases:
+                key = normalize_phrase(phrase)
+                self.stats['lookups'] += 1
+                if key in self.pinned:
+                    found[phrase] = self.pinned[key]
+                    self.stats['pinned_hits'] += 1
+                elif key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[phrase] = self.memory[key]
+                    self.stats['memory_hits'] += 1
+                else:
+                    missing.setdefault(key, []).append(phrase)
+
+        if missing and self.db_path:
+            rows = self._select(list(missing))
+            with self.lock:
+                for key, translation in rows:
+                    self._remember(key, translation)
+                    for phrase in missing.pop(key):
+                        found[phrase] = translation
+                        self.stats['disk_hits'] += 1
+
+        with self.lock:
+            self.stats['misses'] += sum(len(originals) for originals in missing.values())
+            lookups = self.stats['lookups']
+            if lookups // stats_log_interval != (lookups - len(phrases)) // stats_log_interval:
+                logging.info(f"Translation cache: {self.hit_rate():.1%} hit rate, {self.stats}")
+        return found
+
+    def put_many(self, translations):
+        """
+        Сохранение переводов {фраза: перевод} в памяти и в общем файле.
+
+        Для одного нормализованного ключа сохраняется первый перевод: в памяти и в файле всегда одно значение,
+        а если другой процесс записал ключ раньше, в память попадает его перевод из файла.
+        """
+        rows = {}
+        with self.lock:
+            for phrase, translation in translations.items():
+                key = normalize_phrase(phrase)
+                if key in self.pinned or key in self.memory or key in rows:
+                    continue
+                rows[key] = (self.model_key, key, translation, time.time())
+        if not rows:
+            return
+        if self.db_path:
+            connection = self._connection()
+            try:
+                with connection:
+                    connection.executemany('INSERT OR IGNORE INTO translations VALUES (?, ?, ?, ?)', rows.values())
+                stored = dict(self._select(list(rows)))
+                self._prune(len(rows))
+            except sqlite3.Error as e:
+                logging.warning(f"Translation cache write failed: {str(e)}")
+                stored = {}
+        else:
+            stored = {}
+        with self.lock:
+            for key, (_, _, translation, _) in rows.items():
+                self._remember(key, stored.get(key, translation))
+
+    def _prune(self, written):
+        """
+        Удаление самых старых строк файла сверх max_rows (проверка раз в prune_interval записанных строк).
+        """
+        if not self.max_rows:
+            return
+        with self.lock:
+            self.rows_since_prune += written
+            if self.rows_since_prune < prune_interval:
+                return
+            self.rows_since_prune = 0
+        connection = self._connection()
+        with connection:
+            excess = connection.execute('SELECT COUNT(*) FROM translations').fetchone()[0] - self.max_rows
+            if excess > 0:
+                connection.execute('DELETE FROM translations WHERE rowid IN '
+                                   '(SELECT rowid FROM translations ORDER BY created_at LIMIT ?)', (excess,))
+                logging.info(f"Translation cache: removed {excess} oldest rows.")
+
+    def hit_rate(self):
+        lookups = self.stats['lookups']
+        return (lookups - self.stats['misses']) / lookups if lookups else 0.0
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'hit_rate': self.hit_rate(), 'memory_entries': len(self.memory)}
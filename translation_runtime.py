@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import logging
+
+# Среда выполнения модели перевода: 'torch' (эталонный PyTorch fp32) или 'ctranslate2' (int8, жадное декодирование)
+translation_runtime_default = os.environ.get('TRANSLATION_RUNTIME', 'torch')
+# Каталог сконвертированной модели CTranslate2 (создается при первом запуске)
+ctranslate2_model_dir = os.environ.get('TRANSLATION_CT2_DIR', 'opus-mt-ru-en-ct2-int8')
+ctranslate2_compute_type = os.environ.get('TRANSLATION_CT2_COMPUTE_TYPE', 'int8')
+
+# Ограничение длины перевода: коэффициент к длине входа в токенах плюс запас, но не больше max_new_tokens
+output_length_ratio = 1.5
+output_length_margin = 10
+max_new_tokens = 100
+
+
+def output_length_limit(input_length):
+    return min(max_new_tokens, int(input_length * output_length_ratio) + output_length_margin)
+
+
+def runtime_version(runtime=translation_runtime_default, compute_type=ctranslate2_compute_type):
+    # Строка среды выполнения для версии перевода (тип вычислений меняет результат перевода)
+    return f'{runtime}-{compute_type}' if runtime == CTranslate2Translator.name else runtime
+
+
+class TorchTranslator:
+    name = 'torch'
+
+    def __init__(self, model_name):
+        """
+        Эталонная модель MarianMT в PyTorch.
+        """
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+
+    def translate_batch(self, batch):
+        """
+        Перевод пакета фраз одним вызовом generate.
+        """
+        import torch
+        inputs = self.tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            output_ids = self.model.generate(**inputs, max_new_tokens=output_length_limit(inputs['input_ids'].shape[1]))
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+
+class CTranslate2Translator:
+    name = 'ctranslate2'
+
+    def __init__(self, model_name, model_dir=ctranslate2_model_dir, compute_type=ctranslate2_compute_type):
+        """
+        MarianMT на CTranslate2 с квантованием int8 и жадным декодированием.
+
+        Если каталог модели не найден, модель конвертируется из Hugging Face.
+        """
+        try:
+            import ctranslate2
+        except ImportError as e:
+            raise ImportError("Для среды ctranslate2 установите пакет ctranslate2") from e
+        from transformers import AutoTokenizer
+
+        if not os.path.exists(os.path.join(model_dir, 'model.bin')):
+            _convert_model(ctranslate2, model_name, model_dir, compute_type)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.translator = ctranslate2.Translator(model_dir, device='cpu', compute_type=compute_type)
+
+    def translate_batch(self, batch):
+        # Длинный вход обрезается до model_max_length, как в PyTorch (truncation=True)
+        source = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(phrase, truncation=True))
+                  for phrase in batch]
+        results = self.translator.translate_batch(
+            source, beam_size=1, max_decoding_length=output_length_limit(max(len(tokens) for tokens in source)))
+        return [self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(result.hypotheses[0]),
+                                      skip_special_tokens=True) for result in results]
+
+
+def _convert_model(ctranslate2, model_name, model_dir, compute_type):
+    """
+    Конвертация модели во временный каталог и атомарное переименование: процессы обработки и поиска,
+    запущенные одновременно, не перезаписывают файлы друг друга и не читают недописанную модель.
+    """
+    logging.info(f"Converting {model_name} to CTranslate2 ({compute_type}) in {model_dir}")
+    parent_dir = os.path.dirname(os.path.abspath(model_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.ct2-')
+    try:
+        ctranslate2.converters.TransformersConverter(model_name).convert(tmp_dir, quantization=compute_type,
+                                                                         force=True)
+        if os.path.isdir(model_dir) and not os.path.exists(os.path.join(model_dir, 'model.bin')):
+            # Каталог, оставшийся от прерванной конвертации
+            shutil.rmtree(model_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, model_dir)
+        except OSError:
+            # Другой процесс успел сохранить модель первым
+            if not os.path.exists(os.path.join(model_dir, 'model.bin')):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+translation_runtimes = {
+    TorchTranslator.name: TorchTranslator,
+    CTranslate2Translator.name: CTranslate2Translator,
+}
+
+
+def load_translator(model_name, runtime=translation_runtime_default):
+    """
+    Создание модели перевода в выбранной среде выполнения.
+    """
+    if runtime not in translation_runtimes:
+        raise ValueError(f"Неизвестная среда перевода: {runtime}, доступны: {sorted(translation_runtimes)}")
+    translator = translation_runtimes[runtime](model_name)
+    logging.info(f"Loaded translator {model_name} ({runtime})")
+    return translator
@@ -0,0 +1,146 @@
+import pickle
+import numpy as np
+from bson.binary import Binary
+
+# Версия формата хранения векторов в документе MongoDB
+VECTOR_FORMAT_VERSION = 2
+
+# Поддерживаемые типы хранения (little-endian)
+storage_dtypes = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+}
+
+# Порядок модальностей внутри документа видео
+text_vector_fields = [
+    ('description_vector', 'description'),
+    ('subtitle_vector', 'subtitle'),
+    ('audio_vector', 'audio'),
+]
+
+# Поля документа, необходимые для чтения векторов (проекция для find)
+vector_document_projection = {
+    'id': 1, 'vector_format': 1, 'dim': 1, 'dtype': 1, 'index_start': 1,
+    'video_vectors': 1, 'video_vectors_count': 1,
+    'description_vector': 1, 'subtitle_vector': 1, 'audio_vector': 1,
+}
+
+# Подсчет строк индекса средствами MongoDB без передачи векторов
+vector_count_pipeline = [
+    {'$project': {
+        'dim': 1,
+        'rows': {'$add': [
+            {'$cond': [{'$eq': ['$vector_format', VECTOR_FORMAT_VERSION]},
+                       {'$ifNull': ['$video_vectors_count', 0]},
+                       {'$size': {'$ifNull': ['$video_vectors', []]}}]},
+            *[{'$cond': [{'$eq': [{'$ifNull': [f'${field}', None]}, None]}, 0, 1]}
+              for field in ('description_vector', 'subtitle_vector', 'audio_vector')],
+        ]},
+    }},
+    {'$group': {'_id': None, 'rows': {'$sum': '$rows'}, 'dim': {'$max': '$dim'}}},
+]
+
+
+def encode_vector_blob(vectors, dtype='float32'):
+    """
+    Упаковка одного или нескольких векторов в непрерывный блок байт.
+
+    :param vectors: Вектор или список векторов одинаковой размерности.
+    :param dtype: Тип хранения ('float32' или 'float16').
+    :return: Binary с сырыми little-endian байтами.
+    """
+    if dtype not in storage_dtypes:
+        raise ValueError(f"Неподдерживаемый тип хранения векторов: {dtype}")
+    array = np.asarray(vectors, dtype=storage_dtypes[dtype])
+    return Binary(np.ascontiguousarray(array).tobytes())
+
+
+def decode_vector_blob(blob, dim, dtype='float32'):
+    """
+    Распаковка блока байт в матрицу float32 размерности (n, dim).
+
+    :param blob: Байты, записанные encode_vector_blob.
+    :param dim: Размерность векторов.
+    :param dtype: Тип хранения.
+    :return: numpy.ndarray формы (n, dim) типа float32.
+    """
+    array = np.frombuffer(blob, dtype=storage_dtypes[dtype]).reshape(-1, dim)
+    return array.astype('float32', copy=False)
+
+
+def encode_video_document(video_id, video_vectors, description_vector, subtitle_vector, audio_vector, dtype='float32'):
+    """
+    Формирование документа видео в компактном формате.
+
+    Все векторы кадров хранятся одним блоком, размерность и тип хранения записываются в документ.
+
+    :return: Словарь документа для коллекции videos.
+    """
+    text_vectors = [description_vector, subtitle_vector, audio_vector]
+    dim = len(video_vectors[0]) if video_vectors else next((len(vec) for vec in text_vectors if vec is not None), 0)
+    document = {
+        'id': video_id,
+        'vector_format': VECTOR_FORMAT_VERSION,
+        'dim': dim,
+        'dtype': dtype,
+        'video_vectors': encode_vector_blob(video_vectors, dtype) if video_vectors else None,
+        'video_vectors_count': len(video_vectors) if video_vectors else 0,
+    }
+    for (field, _), vec in zip(text_vector_fields, text_vectors):
+        document[field] = encode_vector_blob(vec, dtype) if vec is not None else None
+    return document
+
+
+def _decode_legacy_vector(value):
+    return np.asarray(pickle.loads(value), dtype='float32').reshape(-1)
+
+
+def decode_document_vectors(document):
+    """
+    Извлечение всех векторов документа видео в порядке строк индекса.
+
+    Поддерживает как компактный формат, так и старый формат с pickle-списками.
+
+    :param document: Документ из коллекции videos.
+    :return: Кортеж (матрица float32 формы (n, dim), список типов векторов).
+    """
+    if document.get('vector_format') == VECTOR_FORMAT_VERSION:
+        dim, dtype = document['dim'], document['dtype']
+        blocks = []
+        types = []
+        if document.get('video_vectors'):
+            frames = decode_vector_blob(document['video_vectors'], dim, dtype)
+            blocks.append(frames)
+            types.extend(['video'] * len(frames))
+        for field, vector_type in text_vector_fields:
+            if document.get(field) is not None:
+                blocks.append(decode_vector_blob(document[field], dim, dtype))
+                types.append(vector_type)
+    else:
+        blocks = []
+        types = []
+        for vec in document.get('video_vectors') or []:
+            blocks.append(_decode_legacy_vector(vec))
+            types.append('video')
+        for field, vector_type in text_vector_fields:
+            if document.get(field) is not None:
+                blocks.append(_decode_legacy_vector(document[field]))
+                types.append(vector_type)
+
+    if not blocks:
+        return np.empty((0, document.get('dim') or 0), dtype='float32'), types
+    return np.vstack(blocks), types
+
+
+def count_document_vectors(document):
+    """
+    Количество векторов в документе без их декодирования.
+
+    :param document: Документ из коллекции videos.
+    :return: Количество строк индекса, которые дает документ.
+    """
+    if document.get('vector_format') == VECTOR_FORMAT_VERSION:
+        count = document.get('video_vectors_count', 0)
+    else:
+        count = len(document.get('video_vectors') or [])
+    return count + sum(1 for field, _ in text_vector_fields if document.get(field) is not None)
@@ -0,0 +1,305 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+from faiss_module import FaissIndex  # Ваш класс FaissIndex
+from mongo_connection import get_collection, default_db_name
+from create_FAISS_index import count_vectors_in_db, find_vector_dimension
+from search_ranking import type_weights
+from faiss_sync import load_sync_state
+from vector_codec import decode_document_vectors, vector_document_projection
+
+# Настройка логирования
+logging.basicConfig(filename='processing.log', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(message)s')
+
+# Параметры базы данных
+db_name = default_db_name  # MONGO_DB
+collection_name = 'videos'
+
+# Каталог снимков и указатель на последний снимок
+snapshots_dir = 'snapshots'
+latest_pointer = 'LATEST'
+
+# Версия 2 добавляет файл индекса FAISS (index.faiss), снимки версии 1 по-прежнему читаются
+SNAPSHOT_FORMAT_VERSION = 2
+supported_format_versions = (1, 2)
+index_filename = 'index.faiss'
+# Количество строк, добавляемых в индекс при выгрузке за один вызов
+index_chunk_size = 50000
+
+# Модель, которой получены эмбеддинги (см. Fast_API.clip_id)
+embedding_model_id = 'laion/CLIP-ViT-g-14-laion2B-s12B-b42K'
+
+# Коды модальностей в row_modality.npy
+modalities = ['video', 'description', 'subtitle', 'audio']
+
+
+class _CodeLookup:
+    """
+    Отображение номера строки в значение через массив кодов без построения списков строк.
+    """
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+@dataclass
+class Snapshot:
+    path: str
+    manifest: dict
+    embeddings: np.ndarray
+    row_video: np.ndarray
+    row_modality: np.ndarray
+    videos: list
+
+    @property
+    def ids(self):
+        return _CodeLookup(self.row_video, [video['id'] for video in self.videos])
+
+    @property
+    def types(self):
+        return _CodeLookup(self.row_modality, modalities)
+
+    def video_urls(self):
+        return {video['id']: video.get('url', '') for video in self.videos}
+
+    def total_weights(self):
+        """
+        Суммарный вес векторов каждого видео (аналог search_ranking.compute_total_weights).
+        """
+        modality_weights = np.array([type_weights[modality] for modality in modalities])
+        sums = np.bincount(self.row_video, weights=modality_weights[self.row_modality], minlength=len(self.videos))
+        return {video['id']: float(weight) for video, weight in zip(self.videos, sums)}
+
+    def build_index(self):
+        """
+        Точный индекс FAISS снимка.
+
+        Файл index.faiss отображается в память (IO_FLAG_MMAP), поэтому холодный старт не читает
+        и не копирует все векторы. Для снимков версии 1 индекс строится из матрицы эмбеддингов в памяти.
+        """
+        index = FaissIndex(self.manifest['dim'], index_type='FlatL2')
+        if index_filename in self.manifest['files']:
+            index.load_index(os.path.join(self.path, index_filename), mmap=True)
+        else:
+            index.add_vectors(self.embeddings)
+        return index
+
+
+def _sha256(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(output_dir=snapshots_dir, model_id=embedding_model_id, batch_size=1000):
+    """
+    Выгрузка всего каталога векторов в версионированный каталог снимка.
+
+    Состав снимка: embeddings.npy (непрерывная матрица float32), index.faiss (точный индекс FAISS
+    для загрузки с отображением в память), row_video.npy и row_modality.npy (строка -> видео и модальность),
+    videos.json (метаданные видео) и manifest.json с контрольными суммами и идентификатором модели.
+
+    :param output_dir: Каталог снимков.
+    :param model_id: Идентификатор модели эмбеддингов.
+    :param batch_size: Размер пачки курсора MongoDB.
+    :return: Путь к созданному снимку.
+    """
+    # Момент начала чтения: документы, записанные позже, могут не попасть в снимок
+    source_time = time.time()
+    # Суффикс различает снимки, выгруженные в одну и ту же секунду
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    tmp_path = os.path.join(output_dir, f'.tmp-{version}')
+    snapshot_path = os.path.join(output_dir, version)
+    os.makedirs(tmp_path, exist_ok=True)
+
+    try:
+        collection = get_collection(collection_name, db_name)
+        total_rows, d = count_vectors_in_db(collection)
+        if total_rows == 0:
+            raise ValueError("В коллекции нет векторов для выгрузки снимка")
+        if d is None:
+            d = find_vector_dimension(collection)
+
+        # Векторы пишутся сразу в файл на диске, индекс FAISS строится после чтения из этого файла
+        embeddings_path = os.path.join(tmp_path, 'embeddings.npy')
+        embeddings = np.lib.format.open_memmap(embeddings_path, mode='w+', dtype='float32', shape=(total_rows, d))
+        row_video = np.empty(total_rows, dtype='int32')
+        row_modality = np.empty(total_rows, dtype='int8')
+        modality_codes = {modality: code for code, modality in enumerate(modalities)}
+        # Таблица видео в порядке первого появления
+        video_positions = {}
+        videos = []
+        filled = 0
+
+        cursor = collection.find({}, dict(vector_document_projection, url=1), batch_size=batch_size)
+        for document in cursor:
+            document_vectors, document_types = decode_document_vectors(document)
+            count = min(len(document_types), total_rows - filled)
+            if count == 0:
+                continue
+            if document['id'] not in video_positions:
+                video_positions[document['id']] = len(videos)
+                videos.append({'id': document['id'], 'url': document.get('url', '')})
+            embeddings[filled:filled + count] = document_vectors[:count]
+            row_video[filled:filled + count] = video_positions[document['id']]
+            row_modality[filled:filled + count] = [modality_codes[vector_type] for vector_type in document_types[:count]]
+            filled += count
+            if filled == total_rows:
+                # Документы, добавленные после подсчета, попадут в следующий снимок
+                break
+        cursor.close()
+
+        embeddings.flush()
+        del embeddings
+        if filled < total_rows:
+            # Часть документов удалена во время чтения: обрезаем матрицу до фактического числа строк
+            logging.warning(f"Expected {total_rows} vectors, read {filled}; trimming {embeddings_path}.")
+            trimmed_path = f"{embeddings_path}.trimmed.npy"
+            np.save(trimmed_path, np.load(embeddings_path, mmap_mode='r')[:filled])
+            os.replace(trimmed_path, embeddings_path)
+        embeddings = np.load(embeddings_path, mmap_mode='r')
+        index = FaissIndex(d, index_type='FlatL2')
+        for start in range(0, filled, index_chunk_size):
+            index.add_vectors(np.ascontiguousarray(embeddings[start:start + index_chunk_size]))
+        del embeddings
+        index.save_index(os.path.join(tmp_path, index_filename))
+        del index
+        np.save(os.path.join(tmp_path, 'row_video.npy'), row_video[:filled])
+        np.save(os.path.join(tmp_path, 'row_modality.npy'), row_modality[:filled])
+        with open(os.path.join(tmp_path, 'videos.json'), 'w', encoding='utf-8') as file:
+            json.dump(videos, file, ensure_ascii=False)
+
+        files = {}
+        for filename in sorted(os.listdir(tmp_path)):
+            file_path = os.path.join(tmp_path, filename)
+            files[filename] = {'sha256': _sha256(file_path), 'bytes': os.path.getsize(file_path)}
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'version': version,
+            'created_at': time.time(),
+            'source_time': source_time,
+            'model_id': model_id,
+            'dim': d,
+            'dtype': 'float32',
+            'rows': filled,
+            'videos': len(videos),
+            'modalities': modalities,
+            'files': files,
+        }
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=4)
+
+        os.rename(tmp_path, snapshot_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Атомарное переключение указателя на последний снимок
+    pointer_tmp = os.path.join(output_dir, f'{latest_pointer}.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as file:
+        file.write(version)
+    os.replace(pointer_tmp, os.path.join(output_dir, latest_pointer))
+
+    logging.info(f"Exported snapshot {snapshot_path} with {manifest['rows']} vectors of {manifest['videos']} videos.")
+    return snapshot_path
+
+
+def latest_snapshot_path(output_dir=snapshots_dir):
+    """
+    Путь к последнему снимку или None, если снимков нет.
+    """
+    pointer_path = os.path.join(output_dir, latest_pointer)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, 'r', encoding='utf-8') as file:
+        return os.path.join(output_dir, file.read().strip())
+
+
+def newest_index_source(output_dir=snapshots_dir):
+    """
+    Самый свежий источник индекса для поиска: последний снимок или версия инкрементальной синхронизации.
+
+    Снимок сравнивается с синхронизацией по времени начала выгрузки и времени записи версии индекса,
+    поэтому после выгрузки снимка новые версии синхронизации снова используются поиском.
+
+    :return: ('snapshot', путь к снимку), ('sync', номер версии) или None, если нет ни того, ни другого.
+    """
+    snapshot_path = latest_snapshot_path(output_dir)
+    snapshot_time = None
+    if snapshot_path is not None:
+        with open(os.path.join(snapshot_path, 'manifest.json'), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        snapshot_time = manifest.get('source_time', manifest['created_at'])
+    state = load_sync_state()
+    if state is not None and (snapshot_time is None or state.get('updated_at', 0) > snapshot_time):
+        return 'sync', state['version']
+    if snapshot_path is not None:
+        return 'snapshot', snapshot_path
+    return None
+
+
+def load_snapshot(path=None, verify=False, model_id=None):
+    """
+    Загрузка снимка с отображением матрицы эмбеддингов в память (без обращения к базе данных).
+
+    :param path: Путь к снимку (по умолчанию последний).
+    :param verify: Проверить контрольные суммы файлов.
+    :param model_id: Ожидаемый идентификатор модели эмбеддингов.
+    :return: Экземпляр Snapshot.
+    """
+    path = path or latest_snapshot_path()
+    if path is None:
+        raise FileNotFoundError(f"Снимки в каталоге {snapshots_dir} не найдены")
+    with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    if manifest['format_version'] not in supported_format_versions:
+        raise ValueError(f"Неподдерживаемая версия формата снимка: {manifest['format_version']}")
+    if model_id is not None and manifest['model_id'] != model_id:
+        raise ValueError(f"Снимок построен моделью {manifest['model_id']}, ожидалась {model_id}")
+    if verify:
+        for filename, info in manifest['files'].items():
+            if _sha256(os.path.join(path, filename)) != info['sha256']:
+                raise ValueError(f"Контрольная сумма файла {filename} снимка {path} не совпадает")
+
+    embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+    row_video = np.load(os.path.join(path, 'row_video.npy'))
+    row_modality = np.load(os.path.join(path, 'row_modality.npy'))
+    with open(os.path.join(path, 'videos.json'), 'r', encoding='utf-8') as file:
+        videos = json.load(file)
+    if embeddings.shape != (manifest['rows'], manifest['dim']):
+        raise ValueError(f"Размер матрицы снимка {embeddings.shape} не совпадает с манифестом")
+
+    logging.info(f"Loaded snapshot {path}: {manifest['rows']} vectors, model {manifest['model_id']}.")
+    return Snapshot(path=path, manifest=manifest, embeddings=embeddings, row_video=row_video,
+                    row_modality=row_modality, videos=videos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка и проверка снимков векторов")
+    parser.add_argument('--output-dir', default=snapshots_dir)
+    parser.add_argument('--verify', default=None, help="Проверить контрольные суммы указанного снимка")
+    args = parser.parse_args()
+
+    if args.verify:
+        load_snapshot(args.verify, verify=True)
+        print(f"Snapshot {args.verify} is valid.")
+    else:
+        print(export_snapshot(args.output_dir))
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Параметры скачивания
+chunk_size = 1 << 20  # 1 МБ
+max_video_bytes = 2 << 30  # 2 ГБ
+connect_timeout = 10
+read_timeout = 60
+resume_attempts = 5
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=16):
+    """
+    Общая для процесса сессия requests с пулом keep-alive соединений и повтором запросов.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                              allowed_methods=['GET', 'HEAD'])
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _total_size(response, offset):
+    # Content-Range: bytes 100-999/1000
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get('Content-Length')
+    return offset + int(content_length) if content_length and content_length.isdigit() else None
+
+
+def download_video_stream(video_id, video_url, dest_dir=None, max_bytes=max_video_bytes):
+    """
+    Потоковое скачивание видео на диск кусками без загрузки файла в память.
+
+    Незавершенная загрузка хранится в файле .part и продолжается запросом Range
+    (в том числе при повторной обработке того же видео).
+
+    :param video_id: Идентификатор видео (имя файла).
+    :param video_url: Ссылка на видео.
+    :param dest_dir: Каталог для файла (по умолчанию системный временный каталог).
+    :param max_bytes: Максимальный размер видео.
+    :return: Путь к скачанному файлу.
+    """
+    dest_dir = dest_dir or tempfile.gettempdir()
+    video_path = os.path.join(dest_dir, f"{video_id}.mp4")
+    part_path = f"{video_path}.part"
+    session = get_session()
+
+    complete = False
+    for attempt in range(resume_attempts):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with session.get(video_url, headers=headers, stream=True, timeout=(connect_timeout, read_timeout)) as response:
+                if response.status_code == 416:
+                    total = _total_size(response, offset)
+                    if total is None or offset == total:
+                        complete = True  # Файл уже скачан целиком
+                        break
+                    # Файл .part не соответствует файлу на сервере: скачиваем заново
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0  # Сервер не поддерживает Range, скачиваем заново
+
+                total = _total_size(response, offset)
+                if total is not None and total > max_bytes:
+                    raise ValueError(f"Видео {video_id} больше допустимого размера: {total} > {max_bytes} байт")
+
+                with open(part_path, 'ab' if offset else 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        offset += len(chunk)
+                        if offset > max_bytes:
+                            raise ValueError(f"Видео {video_id} больше допустимого размера {max_bytes} байт")
+                        file.write(chunk)
+                if total is None or offset >= total:
+                    complete = True
+                    break
+                # Сервер закрыл поток без ошибки раньше конца файла: продолжаем с достигнутого места
+                logging.warning(f"Download of {video_id} ended early at {offset} of {total} bytes, "
+                                f"attempt {attempt + 1}/{resume_attempts}")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            logging.warning(f"Download of {video_id} interrupted at {offset} bytes: {str(e)}, "
+                            f"attempt {attempt + 1}/{resume_attempts}")
+            if attempt == resume_attempts - 1:
+                raise
+        except ValueError:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    if not complete:
+        # Недокачанный файл остается в .part и будет продолжен при следующей попытке
+        raise IOError(f"Видео {video_id} скачано не полностью за {resume_attempts} попыток")
+    os.replace(part_path, video_path)
+    logging.info(f"Downloaded {video_id}: {os.path.getsize(video_path)} bytes.")
+    return video_path
+
+
+class VideoPrefetcher:
+    def __init__(self, depth=2, dest_dir=None):
+        """
+        Фоновое скачивание следующих видео, пока обрабатывается текущее.
+
+        :param depth: Количество одновременных скачиваний.
+        :param dest_dir: Каталог для файлов.
+        """
+        self.dest_dir = dest_dir
+        self.executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix='prefetch')
+
+    def submit(self, video_id, video_url):
+        """
+        Запуск скачивания видео.
+
+        :return: Future с путем к файлу.
+        """
+        return self.executor.submit(download_video_stream, video_id, video_url, self.dest_dir)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,164 @@
+import os
+import logging
+
+import numpy as np
+
+# Детектор речи: 'auto' (Silero из faster-whisper, затем webrtcvad, затем энергия сигнала),
+# 'silero', 'webrtc' или 'energy'
+vad_backend_default = os.environ.get('VAD_BACKEND', 'auto')
+# Порог вероятности речи Silero и агрессивность webrtcvad (0-3)
+silero_threshold = 0.5
+webrtc_aggressiveness = 2
+
+# Параметры определения речи по энергии сигнала (запасной вариант без нейросетевого детектора)
+frame_ms = 30
+energy_floor_db = -45.0  # Абсолютный порог громкости, дБ относительно полной шкалы
+noise_margin_db = 10.0  # Превышение над уровнем шума (10-й перцентиль громкости кадров)
+min_speech_sec = 0.3
+min_silence_sec = 0.5
+padding_sec = 0.2
+# Максимальная длина фрагмента для распознавания (окно Whisper - 30 секунд)
+max_chunk_sec = 30.0
+# Фрагменты с паузой меньше этой объединяются в один кусок (большие паузы не распознаются)
+max_merge_gap_sec = 2.0
+
+
+
+def _available_backend(backend=vad_backend_default):
+    """
+    Детектор речи, доступный в окружении: энергия сигнала используется, только если нет ни Silero, ни webrtcvad.
+    """
+    if backend in ('auto', 'silero'):
+        try:
+            import faster_whisper.vad  # noqa: F401
+            return 'silero'
+        except ImportError:
+            if backend == 'silero':
+                raise
+    if backend in ('auto', 'webrtc'):
+        try:
+            import webrtcvad  # noqa: F401
+            return 'webrtc'
+        except ImportError:
+            if backend == 'webrtc':
+                raise
+    if backend not in ('auto', 'energy'):
+        raise ValueError(f"Неизвестный детектор речи: {backend}")
+    logging.warning("Neither faster-whisper (Silero VAD) nor webrtcvad is installed, using energy VAD")
+    return 'energy'
+
+
+vad_backend = _available_backend()
+
+if vad_backend == 'silero':
+    vad_settings = f'silero-v1:{silero_threshold}'
+elif vad_backend == 'webrtc':
+    vad_settings = f'webrtc-v1:{webrtc_aggressiveness}:{frame_ms}'
+else:
+    vad_settings = f'energy-v1:{energy_floor_db}:{noise_margin_db}'
+vad_config = f'{vad_settings}:{min_speech_sec}:{min_silence_sec}:{max_chunk_sec}:{max_merge_gap_sec}'
+
+
+def frame_energy_db(audio, sr, frame_ms=frame_ms):
+    """
+    Громкость (RMS, дБ) последовательных кадров аудио.
+    """
+    frame_length = int(sr * frame_ms / 1000)
+    frame_count = len(audio) // frame_length
+    if frame_count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = audio[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def detect_speech_segments(audio, sr, backend=None):
+    """
+    Поиск фрагментов с речью.
+
+    По умолчанию используется Silero VAD из faster-whisper (отличает речь от музыки и шума),
+    при его отсутствии - webrtcvad, и только без обоих - порог энергии сигнала.
+    Паузы короче min_silence_sec объединяются, фрагменты короче min_speech_sec отбрасываются.
+
+    :param audio: Аудио (float32, моно).
+    :param sr: Частота дискретизации.
+    :param backend: Детектор речи (по умолчанию vad_backend).
+    :return: Список пар (начало, конец) в секундах.
+    """
+    backend = backend or vad_backend
+    if backend == 'silero' and sr == 16000:
+        return _silero_speech_segments(audio, sr)
+    if backend == 'webrtc' and sr in (8000, 16000, 32000, 48000):
+        voiced = _webrtc_voiced_frames(audio, sr)
+    else:
+        voiced = _energy_voiced_frames(audio, sr)
+    return _frames_to_segments(voiced, frame_ms / 1000, len(audio) / sr)
+
+
+def _silero_speech_segments(audio, sr):
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    options = VadOptions(threshold=silero_threshold, min_speech_duration_ms=int(min_speech_sec * 1000),
+                         min_silence_duration_ms=int(min_silence_sec * 1000), speech_pad_ms=int(padding_sec * 1000))
+    return [(timestamp['start'] / sr, timestamp['end'] / sr)
+            for timestamp in get_speech_timestamps(audio, vad_options=options)]
+
+
+def _webrtc_voiced_frames(audio, sr):
+    import webrtcvad
+    vad = webrtcvad.Vad(webrtc_aggressiveness)
+    frame_length = int(sr * frame_ms / 1000)
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    return [vad.is_speech(pcm[start:start + frame_length].tobytes(), sr)
+            for start in range(0, len(pcm) - frame_length + 1, frame_length)]
+
+
+def _energy_voiced_frames(audio, sr):
+    # Кадр считается речью, если он громче абсолютного порога и уровня шума записи
+    energy = frame_energy_db(audio, sr)
+    if not len(energy):
+        return []
+    threshold = max(energy_floor_db, float(np.percentile(energy, 10)) + noise_margin_db)
+    return energy > threshold
+
+
+def _frames_to_segments(voiced, frame_sec, duration):
+    segments = []
+    start = None
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = i
+        elif not is_voiced and start is not None:
+            segments.append([start * frame_sec, i * frame_sec])
+            start = None
+    if start is not None:
+        segments.append([start * frame_sec, len(voiced) * frame_sec])
+
+    merged = []
+    for segment in segments:
+        if merged and segment[0] - merged[-1][1] < min_silence_sec:
+            merged[-1][1] = segment[1]
+        else:
+            merged.append(segment)
+
+    return [(max(0.0, start - padding_sec), min(duration, end + padding_sec))
+            for start, end in merged if end - start >= min_speech_sec]
+
+
+def group_speech_chunks(segments, max_chunk=max_chunk_sec):
+    """
+    Объединение близких фрагментов речи в куски не длиннее max_chunk секунд для распознавания.
+
+    Длинный фрагмент делится на части по max_chunk секунд.
+
+    :return: Список пар (начало, конец) в секундах.
+    """
+    chunks = []
+    for start, end in segments:
+        while end - start > max_chunk:
+            chunks.append((start, start + max_chunk))
+            start += max_chunk
+        if chunks and end - chunks[-1][0] <= max_chunk and start - chunks[-1][1] <= max_merge_gap_sec:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return chunks
@@ -1,51 +1,177 @@
 import os
 import logging
-from moviepy.editor import VideoFileClip
-import whisper
+import multiprocessing
+import subprocess
+import threading
+import numpy as np
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asr_engines import asr_engine_default, load_asr_engine, as_asr_engine
+from keyframe_extraction import probe_video
+from voice_activity import detect_speech_segments, group_speech_chunks
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Частота дискретизации, с которой работает Whisper
+sample_rate = 16000
+
+# Модель Whisper и число процессов для параллельного распознавания кусков речи (1 - в текущем процессе).
+# Каждый процесс пула загружает свою копию модели в дополнение к модели текущего процесса, а пакетная
+# обработка (batch_ingestion) запускает несколько обработчиков, поэтому по умолчанию пул не создается
+whisper_model_name = os.environ.get('WHISPER_MODEL', 'small')
+asr_workers = int(os.environ.get('ASR_WORKERS', '1'))
+# Куски, которые Whisper считает не речью (музыка, шум), отбрасываются
+no_speech_threshold = 0.6
+# Выбор задачи по языку речи: английская речь распознается, остальная сразу переводится Whisper на английский
+# (task='translate'). При отключении речь распознается как русская и переводится отдельно MarianMT
+language_routing = os.environ.get('ASR_LANGUAGE_ROUTING', '1') == '1'
+# Минимальная вероятность языка для выбора задачи; при меньшей речь распознается как русская
+# и переводится MarianMT (музыка, шум и короткие фразы определяются ненадежно)
+language_probability_threshold = float(os.environ.get('ASR_LANGUAGE_MIN_PROBABILITY', '0.7'))
+
+_asr_pool = None
+_asr_pool_lock = threading.Lock()
+_worker_engine = None
+
+
+def _init_asr_worker(engine_name, model_name):
+    global _worker_engine
+    _worker_engine = load_asr_engine(engine_name, model_name)
+
+
+def _transcribe_chunk_in_worker(args):
+    audio, routing = args
+    return _transcribe_chunk(audio, _worker_engine, routing)
+
+
+def get_asr_pool(workers=asr_workers, engine_name=asr_engine_default, model_name=whisper_model_name):
+    """
+    Общий пул процессов распознавания, каждый процесс загружает движок распознавания один раз.
+    """
+    global _asr_pool
+    if _asr_pool is None:
+        with _asr_pool_lock:
+            if _asr_pool is None:
+                _asr_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_init_asr_worker, initargs=(engine_name, model_name))
+    return _asr_pool
+
+
+def route_language(engine, audio, threshold=language_probability_threshold):
+    """
+    Выбор языка и задачи Whisper по речи в audio.
+
+    :return: Кортеж (язык, задача): ('en', 'transcribe') для английской речи, (язык, 'translate')
+             для другой уверенно определенной речи, ('ru', 'transcribe') при неуверенном определении.
+    """
+    language, probability = engine.detect_language(audio)
+    if probability < threshold:
+        logging.info(f"Speech language {language} is uncertain ({probability:.2f}), transcribing as ru")
+        return 'ru', 'transcribe'
+    task = 'transcribe' if language == 'en' else 'translate'
+    logging.info(f"Detected speech language {language} ({probability:.2f}), task {task}")
+    return language, task
 
 
-# Функция для преобразования аудио в текст
-def audio_to_text(audio_path, model):
+def _transcribe_chunk(audio, engine, routing=False):
+    # Язык определяется для каждого куска: вступление или музыка не определяют язык всего видео
+    language, task = route_language(engine, audio) if routing else ('ru', 'transcribe')
+    segments, _ = engine.transcribe(audio, language=language, task=task)
+    return [(segment['start'], segment['end'], segment['text'].strip()) for segment in segments
+            if segment['no_speech_prob'] < no_speech_threshold and segment['text'].strip()]
+
+
+# Функция для распознавания только фрагментов с речью
+def transcribe_speech(audio, model, sr=sample_rate, workers=asr_workers, routing=language_routing):
+    """
+    Распознавание речи с предварительным поиском фрагментов речи (VAD).
+
+    Тишина и паузы не распознаются; куски речи распознаются параллельно в процессах
+    (при workers > 1), метки времени сегментов пересчитываются относительно начала записи.
+    При routing язык определяется для каждого куска речи: английская речь распознается,
+    другая переводится на английский в том же проходе Whisper, а при неуверенном определении
+    кусок распознается как русский (перевод затем выполняет MarianMT).
+
+    :param audio: Аудио 16 кГц float32.
+    :param model: Движок распознавания (ASREngine) или модель openai-whisper текущего процесса
+                  (для workers <= 1 или одного куска).
+    :return: Кортеж (текст или None, список сегментов (начало, конец, текст)).
+    """
+    engine = as_asr_engine(model)
+    chunks = group_speech_chunks(detect_speech_segments(audio, sr))
+    if not chunks:
+        logging.info("No speech detected, transcription skipped")
+        return None, []
+    speech_sec = sum(end - start for start, end in chunks)
+    logging.info(f"Speech: {len(chunks)} chunks, {speech_sec:.1f} of {len(audio) / sr:.1f} seconds")
+
+    chunk_audio = [audio[int(start * sr):int(end * sr)] for start, end in chunks]
+    if workers > 1 and len(chunks) > 1:
+        pool = get_asr_pool(workers, engine.name, getattr(engine, 'model_name', whisper_model_name))
+        chunk_segments = list(pool.map(_transcribe_chunk_in_worker, [(chunk, routing) for chunk in chunk_audio]))
+    else:
+        chunk_segments = [_transcribe_chunk(chunk, engine, routing) for chunk in chunk_audio]
+
+    segments = [(chunk_start + start, chunk_start + end, text)
+                for (chunk_start, _), chunk_result in zip(chunks, chunk_segments)
+                for start, end, text in chunk_result]
+    text = ' '.join(text for _, _, text in segments)
+    return (text if text.strip() else None), segments
+
+
+# Функция для извлечения аудиодорожки в память (16 кГц, моно, float32) без временного файла
+def load_audio(video_path, sr=sample_rate):
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', video_path, '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+         '-ac', '1', '-ar', str(sr), 'pipe:1'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+# Функция для преобразования аудио в текст (audio - массив 16 кГц float32)
+def audio_to_text(audio, model):
     logging.info("Converting audio to text...")
     try:
-        result = model.transcribe(audio_path, language='ru')
+        segments, _ = as_asr_engine(model).transcribe(audio, language='ru')
     except Exception as e:
         logging.error(f"Whisper model error: {e}")
         return None
-    return result['text'] if result['text'].strip() else None
+    text = ''.join(segment['text'] for segment in segments)
+    return text if text.strip() else None
 
 # Функция для извлечения аудио и транскрибации
-def encode_and_transcribe(video_path, model):
+# (raise_errors - передавать исключение вызывающему коду вместо возврата (None, 0), чтобы сбой не попал в кэш)
+def encode_and_transcribe(video_path, model, raise_errors=False):
     if not os.path.exists(video_path):
         logging.error("Video file does not exist")
+        if raise_errors:
+            raise FileNotFoundError(video_path)
         return None, 0
 
-    audio_path = "temp_audio.wav"
     start_time = time.time()
 
     try:
-        # Извлечение аудиодорожки из видеофайла
-        video = VideoFileClip(video_path)
-        video.audio.write_audiofile(audio_path)
-        video.close()
+        # Видео без звуковой дорожки пропускаем до декодирования
+        if not probe_video(video_path).has_audio:
+            logging.info(f"No audio stream in {video_path}, transcription skipped")
+            return None, time.time() - start_time
+
+        # Извлечение аудиодорожки из видеофайла в память
+        audio = load_audio(video_path)
 
-        # Транскрибация аудио
-        transcription = audio_to_text(audio_path, model)
+        # Транскрибация только фрагментов с речью
+        transcription, _ = transcribe_speech(audio, model)
     except Exception as e:
         logging.error(f"Error processing video: {e}")
+        if raise_errors:
+            raise
         return None, 0
-    finally:
-        # Удаление временного аудиофайла, если он существует
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
 
     processing_time = time.time() - start_time
     return transcription, processing_time
 
 # Пример вызова функции
-# encode_and_transcribe('path_to_video.mp4', whisper_model)
+# encode_and_transcribe('path_to_video.mp4', load_asr_engine('faster-whisper', 'small'))